@@ -0,0 +1,168 @@
+"""
+Raw page archive and offline re-parse.
+
+While crawling with --archive DIR every case is stored as it was fetched: the
+case details page and the business on date panel of every hearing go into one
+gzip compressed JSON bundle per fetch,
+
+    DIR/cases/<cnr>/<fetched at>.json.gz
+
+and each search results page into DIR/results/<job>/<fetched at>.html.gz.
+
+`python main.py --reparse --archive DIR` rebuilds the case documents from the
+newest bundle of every CNR on a process pool, without touching the portal. A
+broken selector or a new field then costs minutes of CPU instead of a
+re-crawl.
+"""
+
+import gzip
+import json
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from parsing import next_hearing_at, parse_business_on_date, parse_case_details
+
+logger = logging.getLogger("scraper")
+
+TIMESTAMP_FORMAT = "%Y%m%dT%H%M%S%f"
+
+
+def safe_name(text):
+    return re.sub(r"[^A-Za-z0-9]+", "_", text).strip("_")
+
+
+def write_gzip(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class PageArchive:
+    def __init__(self, root):
+        self.root = root
+        self.case_html = None
+        self.business = []
+
+    # Crawling ###################################################
+    def stage_case(self, html):
+        """
+        Remembers the details page of the case being scraped.
+        """
+        self.case_html = html
+        self.business = []
+
+    def stage_business(self, pages):
+        """
+        Remembers the business on date HTML of every hearing row, in row order.
+        """
+        self.business = list(pages)
+
+    def commit(self, case_data):
+        """
+        Writes the staged pages of a case once its document has been saved.
+        """
+        html, business = self.case_html, self.business
+        self.case_html, self.business = None, []
+        if html is None:
+            return None
+
+        cnr_number = case_data.get("details", {}).get("cnr_number")
+        if not cnr_number:
+            logger.error("Not archiving a case without CNR number")
+            return None
+
+        fetched_at = datetime.now()
+        path = os.path.join(
+            self.root,
+            "cases",
+            safe_name(cnr_number),
+            f"{fetched_at.strftime(TIMESTAMP_FORMAT)}.json.gz",
+        )
+        bundle = {
+            "cnr_number": cnr_number,
+            "fetched_at": fetched_at.isoformat(),
+            "state": case_data.get("state"),
+            "district": case_data.get("district"),
+            "court_complex": case_data.get("court_complex"),
+            "case": html,
+            "business": business,
+        }
+        write_gzip(path, json.dumps(bundle))
+        return path
+
+    def save_results(self, job_key, html):
+        path = os.path.join(
+            self.root,
+            "results",
+            safe_name(job_key),
+            f"{datetime.now().strftime(TIMESTAMP_FORMAT)}.html.gz",
+        )
+        write_gzip(path, html)
+        return path
+
+
+# Re-parsing #####################################################
+def latest_bundles(root):
+    """
+    Path of the newest bundle of every archived CNR.
+    """
+    cases_dir = os.path.join(root, "cases")
+    if not os.path.isdir(cases_dir):
+        return []
+    paths = []
+    for cnr_dir in sorted(os.listdir(cases_dir)):
+        names = [
+            name
+            for name in os.listdir(os.path.join(cases_dir, cnr_dir))
+            if name.endswith(".json.gz")
+        ]
+        if names:
+            paths.append(os.path.join(cases_dir, cnr_dir, max(names)))
+    return paths
+
+
+def rebuild_case(path):
+    """
+    The case_data document of an archived bundle, exactly as the scraper would
+    have built it (order urls excepted, they live in the stored document).
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        bundle = json.load(f)
+
+    case_data = parse_case_details(bundle["case"])
+    for i, entry in enumerate(case_data["history"]):
+        html = bundle["business"][i] if i < len(bundle["business"]) else ""
+        entry["business_on_date"] = parse_business_on_date(html) if html else {}
+
+    case_data["state"] = bundle.get("state")
+    case_data["district"] = bundle.get("district")
+    case_data["court_complex"] = bundle.get("court_complex")
+    case_data["next_hearing_at"] = next_hearing_at(case_data["status"])
+    case_data["scraped_at"] = datetime.fromisoformat(bundle["fetched_at"])
+    return case_data
+
+
+def _rebuild_or_none(path):
+    try:
+        return rebuild_case(path)
+    except Exception as e:
+        logger.error(f"Could not re-parse {path}: {e}")
+        return None
+
+
+def reparse(root, workers=None, chunksize=64):
+    """
+    Yields the rebuilt document of every archived CNR, parsed on `workers`
+    processes.
+    """
+    paths = latest_bundles(root)
+    print(f"Re-parsing {len(paths)} archived cases.")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for case_data in executor.map(_rebuild_or_none, paths, chunksize=chunksize):
+            if case_data is not None:
+                yield case_data
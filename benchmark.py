@@ -0,0 +1,309 @@
+"""
+Offline benchmark of the scraper against a recorded eCourts fixture.
+
+Record a fixture once from the live portal with a browser crawl, which
+stores everything Chrome loads (pages, scripts, search form, captcha,
+results, case pages, order modals and PDFs) as well as the business on date
+requests made next to it:
+
+    python main.py --record fixtures/karkardooma --years 2024
+
+and measure every change against it, with the live portal out of the loop:
+
+    python benchmark.py fixtures/karkardooma --latency 0.2 --output before.json
+
+The recordings are served by replay_server.py, with --latency,
+--throttle-rate and --fail-rate as there. The benchmarks are:
+
+* parse: parse_case_details over every recorded case page, CPU only,
+* extract: extract_case_details_http for every case of the recorded results,
+* crawl: main.main() with --http against the fixture,
+* browser (experimental): main.main() in headless Chrome against the
+  fixture, the real search -> case -> business on date -> order modal flow
+  through extract_case_details,
+* snapshot (experimental): the same with --snapshot
+  (extract_case_details_snapshot).
+
+browser and snapshot have not been run against a recorded fixture yet, so
+their numbers (and whether the replayed flow completes) are unverified.
+
+Extra arguments are passed on to main.main(), e.g. --config, --years,
+--business-workers or --capture-pdfs. The crawl benchmarks need a fixture
+that covers the searches of the config.
+
+Each reports cases/min and p50/p90/p99 per stage; the peak RSS of the process
+and of the largest browser process come last. Cases and PDFs are counted and
+dropped instead of stored, so no Mongo or Azure is needed; --store keeps the
+real storage.
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+import tempfile
+import time
+
+import main
+import metrics
+from blob_storage import blob_name_for
+from ecourts_client import SUBMIT_CASE_TYPE, VIEW_HISTORY, EcourtsClient
+from metrics import count, timed
+from parsing import parse_case_details, parse_case_links, parse_results_page
+from replay_server import load_recordings, start_in_background
+
+PERCENTILES = (50, 90, 99)
+BENCHMARKS = ["parse", "extract", "crawl", "browser", "snapshot"]
+
+
+def recorded_json(recordings, endpoint):
+    """
+    Decoded JSON bodies of the recorded POSTs to `endpoint`.
+    """
+    bodies = []
+    for recording in recordings.get(("POST", endpoint), []):
+        body = base64.b64decode(recording["body"]).decode("utf-8")
+        try:
+            bodies.append(json.loads(body.lstrip("\ufeff")))
+        except ValueError:
+            continue
+    return bodies
+
+
+def recorded_results(recordings):
+    """
+    Every result row of the recorded searches, once per CNR number.
+    """
+    results = {}
+    for body in recorded_json(recordings, SUBMIT_CASE_TYPE):
+        for result in parse_results_page(body.get("case_data", "")):
+            results.setdefault(result["cnr_number"] or result["onclick"], result)
+    return list(results.values())
+
+
+def discard_storage():
+    """
+    Counts cases and PDFs instead of writing them to Mongo and Azure.
+    """
+
+    def save_case(case_data, on_stored=None):
+        count("cases_discarded")
+        if on_stored is not None:
+            on_stored()
+
+    def store_pdf_bytes(data, details):
+        count("pdfs_discarded")
+        return blob_name_for(data)
+
+    def upload_pdf_stream_to_azure(stream, details):
+        return store_pdf_bytes(stream.read(), details)
+
+    main.save_case = save_case
+    main.store_pdf_bytes = store_pdf_bytes
+    main.upload_pdf_stream_to_azure = upload_pdf_stream_to_azure
+    main.patch_order_url = lambda cnr_number, index, url: None
+
+
+# Benchmarks #####################################################
+def bench_parse(recordings, rounds):
+    pages = [
+        body.get("data_list", "")
+        for body in recorded_json(recordings, VIEW_HISTORY)
+        if body.get("data_list")
+    ]
+    for _ in range(rounds):
+        for html in pages:
+            with timed("parse"):
+                parse_case_details(html)
+                parse_case_links(html)
+    return len(pages) * rounds
+
+
+def bench_extract(recordings, base_url):
+    results = recorded_results(recordings)
+    http = EcourtsClient(base_url=base_url)
+    for result in results:
+        with timed("case"):
+            main.extract_case_details_http(http, result["onclick"])
+    http.session.close()
+    return len(results)
+
+
+def bench_main(base_url, main_args):
+    """
+    Runs main.main() against the fixture with `main_args`. Returns the number
+    of cases scraped.
+    """
+    workdir = tempfile.mkdtemp(prefix="benchmark-")
+    sys.argv = [
+        "main.py",
+        "--base-url",
+        base_url,
+        "--force",
+        "--checkpoint",
+        os.path.join(workdir, "checkpoints.sqlite3"),
+        "--metrics-file",
+        os.path.join(workdir, "metrics.json"),
+        *main_args,
+    ]
+    main.main()
+    # The next run starts a browser with its own options
+    main.BROWSER_SESSION = None
+    return sum(
+        histogram["count"]
+        for (stage, _), histogram in metrics.snapshot()["histograms"].items()
+        if stage == "case_details"
+    )
+
+
+# Reporting ######################################################
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, round(q / 100 * (len(ordered) - 1)))]
+
+
+def stage_percentiles():
+    """
+    {stage: {count, p50, p90, p99, max}} of everything recorded so far, over
+    all labels.
+    """
+    samples = {}
+    for (stage, _), histogram in metrics.snapshot()["histograms"].items():
+        samples.setdefault(stage, []).extend(histogram.get("samples", []))
+    report = {}
+    for stage, values in samples.items():
+        if values:
+            report[stage] = {"count": len(values), "max": max(values)}
+            for q in PERCENTILES:
+                report[stage][f"p{q}"] = percentile(values, q)
+    return report
+
+
+def peak_rss_mb(children=False):
+    """
+    Peak RSS of this process, or with `children` of its largest finished
+    child process (Chrome and its renderers, once the browser quit).
+    """
+    try:
+        import resource
+    except ImportError:
+        # Windows
+        import psutil
+
+        if children:
+            return None
+        return psutil.Process().memory_info().peak_wset / 2**20
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    peak = resource.getrusage(who).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def run(name, bench, *args):
+    """
+    Runs one benchmark on fresh metrics and prints its report.
+    """
+    metrics.drain()
+    start = time.perf_counter()
+    cases = bench(*args)
+    seconds = time.perf_counter() - start
+    stages = stage_percentiles()
+
+    print(f"\n== {name}: {cases} cases in {seconds:.1f}s", end="")
+    print(f", {cases / seconds * 60:.1f} cases/min" if seconds and cases else "")
+    header = "".join(f"{f'p{q}':>9}" for q in PERCENTILES)
+    print(f"{'stage':<18}{'count':>7}{header}{'max':>9}")
+    for stage, row in sorted(stages.items(), key=lambda i: -i[1]["count"]):
+        values = "".join(f"{row[f'p{q}']:>9.3f}" for q in PERCENTILES)
+        print(f"{stage:<18}{row['count']:>7}{values}{row['max']:>9.3f}")
+
+    return {
+        "cases": cases,
+        "seconds": seconds,
+        "cases_per_min": cases / seconds * 60 if seconds else 0.0,
+        "stages": stages,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the scraper against recorded portal responses",
+        epilog="Unknown arguments are passed on to main.py for the crawl, browser "
+        "and snapshot benchmarks.",
+    )
+    parser.add_argument("recording_dir")
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Seconds added to every fixture response (default: %(default)s)",
+    )
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--rounds",
+        type=int,
+        default=5,
+        help="Passes over the recorded case pages for parse (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--only",
+        choices=BENCHMARKS,
+        nargs="+",
+        default=BENCHMARKS,
+        help="Benchmarks to run (default: all)",
+    )
+    parser.add_argument(
+        "--store",
+        action="store_true",
+        help="Store cases and PDFs in the configured Mongo and Azure",
+    )
+    parser.add_argument(
+        "--output", metavar="PATH", help="Also write the report as JSON"
+    )
+    args, extra_args = parser.parse_known_args()
+
+    recordings = load_recordings(args.recording_dir)
+    server, base_url = start_in_background(
+        args.recording_dir,
+        throttle_rate=args.throttle_rate,
+        fail_rate=args.fail_rate,
+        latency=args.latency,
+    )
+    print(f"Replaying {args.recording_dir} on {base_url}")
+
+    metrics.keep_samples()
+    if not args.store:
+        discard_storage()
+
+    report = {"recording_dir": args.recording_dir, "latency": args.latency}
+    if "parse" in args.only:
+        report["parse"] = run("parse", bench_parse, recordings, args.rounds)
+    if "extract" in args.only:
+        report["extract"] = run("extract", bench_extract, recordings, base_url)
+    if "crawl" in args.only:
+        report["crawl"] = run("crawl", bench_main, base_url, ["--http", *extra_args])
+    if "browser" in args.only:
+        report["browser"] = run(
+            "browser", bench_main, base_url, ["--headless", *extra_args]
+        )
+    if "snapshot" in args.only:
+        report["snapshot"] = run(
+            "snapshot", bench_main, base_url, ["--headless", "--snapshot", *extra_args]
+        )
+    server.shutdown()
+
+    report["peak_rss_mb"] = peak_rss_mb()
+    report["peak_browser_rss_mb"] = peak_rss_mb(children=True)
+    print(f"\nPeak RSS: {report['peak_rss_mb']:.0f} MB", end="")
+    if report["peak_browser_rss_mb"]:
+        print(
+            f", largest child (browser) process {report['peak_browser_rss_mb']:.0f} MB"
+        )
+    else:
+        print()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
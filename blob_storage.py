@@ -0,0 +1,112 @@
+"""
+Shared, content addressed blob storage for order PDFs.
+
+One BlobServiceClient (with a pooled HTTP session) is built per process and
+reused for every upload. Blob names are the SHA-256 of the PDF bytes, so
+uploading a PDF that is already stored costs a single existence check and
+re-scrapes never upload the same bytes twice. The Azure SDK is only imported
+when the first PDF is uploaded.
+"""
+
+import hashlib
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Connections kept open to the storage account
+POOL_SIZE = 16
+
+# PDFs above MAX_SINGLE_PUT_SIZE are sent as BLOCK_SIZE blocks, UPLOAD_CONCURRENCY
+# blocks at a time
+MAX_SINGLE_PUT_SIZE = 4 * 1024 * 1024
+BLOCK_SIZE = 4 * 1024 * 1024
+UPLOAD_CONCURRENCY = 4
+
+_container_client = None
+_known_blobs = set()
+_lock = threading.Lock()
+
+
+def get_container_client():
+    """
+    The process wide container client, created on first use.
+    """
+    global _container_client
+
+    with _lock:
+        if _container_client is None:
+            from azure.core.pipeline.transport import RequestsTransport
+            from azure.storage.blob import BlobServiceClient
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+
+            service_client = BlobServiceClient.from_connection_string(
+                os.getenv("AZURE_CONNECTION_STRING"),
+                transport=RequestsTransport(session=session, session_owner=False),
+                max_single_put_size=MAX_SINGLE_PUT_SIZE,
+                max_block_size=BLOCK_SIZE,
+            )
+            _container_client = service_client.get_container_client(
+                os.getenv("AZURE_CONTAINER_NAME")
+            )
+        return _container_client
+
+
+def reset_blob_client():
+    """
+    Drops the shared client, e.g. in a freshly forked worker process.
+    """
+    global _container_client
+
+    with _lock:
+        _container_client = None
+        _known_blobs.clear()
+
+
+def blob_name_for(data):
+    return f"{hashlib.sha256(data).hexdigest()}.pdf"
+
+
+def upload_pdf_bytes(data):
+    """
+    Stores the PDF under its content hash and returns the blob url.
+    """
+    from azure.core.exceptions import ResourceExistsError
+    from azure.storage.blob import ContentSettings
+
+    blob_name = blob_name_for(data)
+    blob_client = get_container_client().get_blob_client(blob_name)
+
+    if blob_name in _known_blobs or blob_client.exists():
+        _known_blobs.add(blob_name)
+        return blob_client.url
+
+    try:
+        blob_client.upload_blob(
+            data,
+            overwrite=False,
+            max_concurrency=UPLOAD_CONCURRENCY,
+            content_settings=ContentSettings(content_type="application/pdf"),
+        )
+    except ResourceExistsError:
+        # Uploaded by another worker in the meantime, same bytes
+        pass
+
+    _known_blobs.add(blob_name)
+    return blob_client.url
+
+
+def blob_name_from_url(url):
+    """
+    Blob name of a url returned by upload_pdf_bytes (the content hash + .pdf).
+    """
+    return url.rsplit("?", 1)[0].rsplit("/", 1)[-1]
+
+
+def download_pdf_bytes(blob_name):
+    return get_container_client().get_blob_client(blob_name).download_blob().readall()
@@ -0,0 +1,195 @@
+"""
+Long-lived browser session for a worker.
+
+The first search of a worker opens the portal and walks the state ->
+district -> court complex dropdowns. Later searches in the same court
+complex only touch the form fields that differ (case type, status radio,
+year) before the captcha is solved again. A driver whose session died is
+replaced transparently and the navigation is redone.
+"""
+
+import logging
+
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.select import Select
+
+from governor import get_governor
+from waits import attribute_changed, dismiss_validate_error, option_present, wait_for
+
+logger = logging.getLogger("scraper")
+
+
+class BrowserSession:
+    def __init__(self, create_driver, url):
+        """
+        create_driver() -> a new webdriver instance
+        """
+        self.create_driver = create_driver
+        self.url = url
+        self.driver = None
+        self.location = None  # (state, district, court complex) of the open form
+        self.navigations = 0
+        self.restarts = 0
+
+    def alive(self):
+        if self.driver is None:
+            return False
+        try:
+            self.driver.current_url
+            return True
+        except WebDriverException:
+            return False
+
+    def ensure_driver(self):
+        """
+        Returns a working driver, replacing a dead one.
+        """
+        if not self.alive():
+            if self.driver is not None:
+                logger.warning("Browser session died, starting a new one")
+                self.restarts += 1
+                self.quit()
+            self.driver = self.create_driver()
+            self.location = None
+        return self.driver
+
+    def quit(self):
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except WebDriverException:
+                pass
+        self.driver = None
+        self.location = None
+
+    def open_search_form(self, state, district, court_complex):
+        """
+        Brings the case type search form of the court complex on screen,
+        navigating from the home page only if another complex (or nothing)
+        is open. A reused form gets a fresh captcha.
+        """
+        driver = self.ensure_driver()
+
+        if self.location == (state, district, court_complex):
+            try:
+                self._back_to_search_form(driver)
+                self._show_case_type_tab(driver)
+                self._refresh_captcha(driver)
+                return driver
+            except WebDriverException as e:
+                logger.warning(f"Search form lost ({e}), navigating again")
+
+        self.location = None
+        self.navigations += 1
+        get_governor().call(driver.get, self.url, retry_on=(TimeoutException,))
+
+        # Click "Case Status"
+        element = wait_for(
+            driver, "home", EC.element_to_be_clickable((By.ID, "leftPaneMenuCS"))
+        )
+        element.click()
+
+        # State
+        state_dropdown = Select(
+            wait_for(driver, "state", option_present((By.ID, "sess_state_code"), state))
+        )
+        state_dropdown.select_by_visible_text(state)
+
+        # District (filled in once the state is chosen)
+        dist_dropdown = Select(
+            wait_for(
+                driver, "district", option_present((By.ID, "sess_dist_code"), district)
+            )
+        )
+        dist_dropdown.select_by_visible_text(district)
+
+        # Court complex (filled in once the district is chosen)
+        court_dropdown = Select(
+            wait_for(
+                driver,
+                "court_complex",
+                option_present((By.ID, "court_complex_code"), court_complex),
+            )
+        )
+        court_dropdown.select_by_visible_text(court_complex)
+
+        # Close any "validateError" modal if present
+        dismiss_validate_error(driver)
+
+        self._show_case_type_tab(driver)
+        self.location = (state, district, court_complex)
+        return driver
+
+    def fill_search_form(self, case_type_option, button_id, year):
+        """
+        Sets case type, year and status radio, skipping fields that already
+        hold the wanted value.
+        """
+        driver = self.driver
+
+        # Select the case type
+        case_type_dropdown = Select(
+            wait_for(
+                driver,
+                "case_type",
+                option_present((By.ID, "case_type_2"), case_type_option),
+            )
+        )
+        if case_type_dropdown.first_selected_option.text.strip() != case_type_option:
+            case_type_dropdown.select_by_visible_text(case_type_option)
+
+        # Year input
+        year_input = wait_for(
+            driver,
+            "search_year",
+            EC.presence_of_element_located((By.ID, "search_year")),
+        )
+        if year_input.get_attribute("value") != year:
+            year_input.clear()
+            year_input.send_keys(year)
+
+        # Close any leftover modal
+        dismiss_validate_error(driver)
+
+        # Select "Disposed" / "Pending" radio button
+        status_radio_button = wait_for(
+            driver, "status_radio", EC.element_to_be_clickable((By.ID, button_id))
+        )
+        if not status_radio_button.is_selected():
+            driver.execute_script("arguments[0].click();", status_radio_button)
+
+    def _back_to_search_form(self, driver):
+        """
+        Leaves the case (or result list) the last search ended on through the
+        portal's back button.
+        """
+        dismiss_validate_error(driver)
+        for button in driver.find_elements(
+            By.XPATH, "//*[contains(@onclick,'back_fun')]"
+        ):
+            if button.is_displayed():
+                driver.execute_script("arguments[0].click();", button)
+                break
+
+    def _refresh_captcha(self, driver):
+        captcha_src = wait_for(
+            driver,
+            "captcha",
+            EC.presence_of_element_located((By.ID, "captcha_image")),
+        ).get_attribute("src")
+        driver.execute_script("refreshCaptcha();")
+        wait_for(
+            driver,
+            "captcha",
+            attribute_changed((By.ID, "captcha_image"), "src", captcha_src),
+        )
+
+    def _show_case_type_tab(self, driver):
+        case_type_button = wait_for(
+            driver,
+            "case_type_tab",
+            EC.element_to_be_clickable((By.ID, "casetype-tabMenu")),
+        )
+        case_type_button.click()
@@ -0,0 +1,176 @@
+"""
+In-memory captcha solving.
+
+The captcha PNG never touches the disk: it is decoded from bytes, cleaned up
+with NumPy (grayscale, median denoise, Otsu threshold, upscale) and read by
+Tesseract restricted to the captcha charset. Callers retry with a fresh
+captcha up to MAX_ATTEMPTS times when the portal rejects a guess.
+
+Offline benchmark over a folder of labelled captchas (<label>.png, or
+<label>_<n>.png for several samples of the same text):
+
+    python captcha_solver.py bench captchas/
+"""
+
+import argparse
+import io
+import os
+import re
+import sys
+import time
+
+import numpy as np
+import pytesseract
+from PIL import Image
+
+CHARSET = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+TESSERACT_CONFIG = f"--psm 7 --oem 3 -c tessedit_char_whitelist={CHARSET}"
+
+# Tesseract binary when it is not on the PATH (TESSERACT_CMD overrides it)
+TESSERACT_CMD = os.getenv("TESSERACT_CMD") or (
+    r"C:\Program Files\Tesseract-OCR\tesseract.exe" if os.name == "nt" else None
+)
+if TESSERACT_CMD:
+    pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+
+# Times a search is retried with a fresh captcha before the job gives up
+MAX_ATTEMPTS = 5
+
+UPSCALE = 3
+
+
+def median_filter(pixels):
+    """
+    3x3 median filter, removes the salt and pepper noise of the captcha.
+    """
+    padded = np.pad(pixels, 1, mode="edge")
+    height, width = pixels.shape
+    windows = np.stack(
+        [
+            padded[dy : dy + height, dx : dx + width]
+            for dy in range(3)
+            for dx in range(3)
+        ]
+    )
+    return np.median(windows, axis=0).astype(np.uint8)
+
+
+def otsu_threshold(pixels):
+    histogram = np.bincount(pixels.ravel(), minlength=256).astype(np.float64)
+    total = pixels.size
+    weights = np.cumsum(histogram)
+    means = np.cumsum(histogram * np.arange(256))
+    background = weights
+    foreground = total - weights
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_bg = means / background
+        mean_fg = (means[-1] - means) / foreground
+        variance = background * foreground * (mean_bg - mean_fg) ** 2
+    if np.isnan(variance).all():
+        # Single colour image
+        return 127
+    return int(np.nanargmax(variance))
+
+
+def preprocess(png_bytes):
+    """
+    Captcha PNG bytes -> black text on white, ready for Tesseract.
+    """
+    image = Image.open(io.BytesIO(png_bytes)).convert("L")
+    pixels = median_filter(np.asarray(image, dtype=np.uint8))
+    binary = np.where(pixels > otsu_threshold(pixels), 255, 0).astype(np.uint8)
+
+    # Tesseract wants dark text on a light background
+    if (binary == 0).mean() > 0.5:
+        binary = 255 - binary
+
+    cleaned = Image.fromarray(binary)
+    return cleaned.resize(
+        (cleaned.width * UPSCALE, cleaned.height * UPSCALE), Image.NEAREST
+    )
+
+
+def solve(png_bytes):
+    """
+    Best guess for the text of a captcha image.
+    """
+    text = pytesseract.image_to_string(preprocess(png_bytes), config=TESSERACT_CONFIG)
+    return "".join(ch for ch in text if ch in CHARSET)
+
+
+# Benchmark ######################################################
+def label_for(filename):
+    stem = os.path.splitext(filename)[0]
+    return re.sub(r"_\d+$", "", stem)
+
+
+def benchmark(folder):
+    """
+    Solves every labelled captcha in `folder`. Returns a summary dict.
+    """
+    samples = sorted(
+        name
+        for name in os.listdir(folder)
+        if name.lower().endswith((".png", ".jpg", ".jpeg"))
+    )
+    correct = 0
+    chars_correct = 0
+    chars_total = 0
+    timings = []
+    misses = []
+
+    for name in samples:
+        with open(os.path.join(folder, name), "rb") as f:
+            data = f.read()
+        label = label_for(name)
+
+        start = time.perf_counter()
+        guess = solve(data)
+        timings.append((time.perf_counter() - start) * 1000)
+
+        if guess == label:
+            correct += 1
+        else:
+            misses.append((name, guess))
+        chars_correct += sum(a == b for a, b in zip(guess, label))
+        chars_total += len(label)
+
+    timings.sort()
+    count = len(samples)
+    return {
+        "samples": count,
+        "accuracy": correct / count if count else 0.0,
+        "char_accuracy": chars_correct / chars_total if chars_total else 0.0,
+        "ms_mean": sum(timings) / count if count else 0.0,
+        "ms_p50": timings[count // 2] if count else 0.0,
+        "ms_p95": timings[min(count - 1, int(count * 0.95))] if count else 0.0,
+        "misses": misses,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Captcha solver tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    bench = subparsers.add_parser("bench", help="Accuracy / speed over labelled images")
+    bench.add_argument("folder")
+    bench.add_argument("--show-misses", action="store_true")
+    solve_parser = subparsers.add_parser("solve", help="Solve a single image")
+    solve_parser.add_argument("image")
+    args = parser.parse_args()
+
+    if args.command == "solve":
+        with open(args.image, "rb") as f:
+            print(solve(f.read()))
+        sys.exit(0)
+
+    result = benchmark(args.folder)
+    print(f"samples        {result['samples']}")
+    print(f"accuracy       {result['accuracy']:.1%}")
+    print(f"char accuracy  {result['char_accuracy']:.1%}")
+    print(
+        f"ms per solve   mean {result['ms_mean']:.1f}  "
+        f"p50 {result['ms_p50']:.1f}  p95 {result['ms_p95']:.1f}"
+    )
+    if args.show_misses:
+        for name, guess in result["misses"]:
+            print(f"  {name}: got {guess!r}")
@@ -0,0 +1,199 @@
+"""
+Crawl checkpoints in a local SQLite file.
+
+Three things are remembered:
+
+* jobs   - (court, case type, status, year) searches that ran to the end
+* units  - result rows of a job that were scraped and stored
+* cases  - every stored CNR number with the state it was stored in
+
+On restart finished jobs and finished result rows are skipped, so a crawl
+resumes at the first unfinished unit. Once every job of a crawl is finished
+the job/unit checkpoints are cleared and the next run starts a new crawl.
+With the shared job queue (--queue) the queue decides when a new crawl
+starts; its units are keyed by the crawl the job was queued for instead.
+Cases are kept across crawls: a stored case is skipped as long as it cannot
+have changed (it is disposed, or its next hearing date is still ahead).
+"""
+
+import sqlite3
+import threading
+import time
+from datetime import date
+
+from parsing import next_hearing_at
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_key TEXT PRIMARY KEY,
+    total INTEGER,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS units (
+    job_key TEXT,
+    result_index INTEGER,
+    cnr_number TEXT,
+    finished_at REAL,
+    PRIMARY KEY (job_key, result_index)
+);
+CREATE TABLE IF NOT EXISTS cases (
+    cnr_number TEXT PRIMARY KEY,
+    disposed INTEGER,
+    next_hearing_date TEXT,
+    scraped_at REAL
+);
+"""
+
+
+def unit_key(job, crawl=None):
+    """
+    Key the result rows of a scheduler.Job are checkpointed under. Shards of
+    a search share it, since they share the result list. `crawl` tells the
+    crawls of a queued job apart, so rows stored in an earlier crawl do not
+    count as done in the next one.
+    """
+    key = "|".join(
+        [
+            job.state,
+            job.district,
+            job.court_complex,
+            job.case_type,
+            job.status,
+            job.year,
+        ]
+    )
+    return f"{key}@{crawl}" if crawl is not None else key
+
+
+def job_key(job):
+    key = unit_key(job)
+    return f"{key}|{job.shard}/{job.shards}" if job.shards > 1 else key
+
+
+def next_hearing(case_data):
+    """
+    ISO date of the case's next hearing, or None.
+    """
+    hearing = next_hearing_at(case_data.get("status", {}))
+    return hearing.date().isoformat() if hearing else None
+
+
+def is_disposed(case_data):
+    status = case_data.get("status", {})
+    return (
+        bool(status.get("decision_date"))
+        or "dispos" in (status.get("case_status") or "").lower()
+    )
+
+
+class CheckpointStore:
+    def __init__(self, path="checkpoints.sqlite3"):
+        # Several pool workers share the file; wait for each other's writes.
+        # Units are finished from the Mongo writer's flush thread.
+        self.db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.units_finished = 0  # by finish_unit() on this store
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    # Jobs #######################################################
+    def job_done(self, key):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT finished_at FROM jobs WHERE job_key = ?", (key,)
+            ).fetchone()
+        return bool(row and row[0])
+
+    def finish_job(self, key, total):
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?)",
+                (key, total, time.time()),
+            )
+
+    def start_crawl(self, keys, force=False):
+        """
+        Called once per run with every job of the crawl. Returns the jobs that
+        still have to run.
+        """
+        if force or all(self.job_done(key) for key in keys):
+            with self.lock, self.db:
+                self.db.execute("DELETE FROM jobs")
+                self.db.execute("DELETE FROM units")
+        return [key for key in keys if not self.job_done(key)]
+
+    def forget_crawls(self, key):
+        """
+        Drops the rows of the other crawls of the search `key` (a unit_key()
+        with a crawl).
+        """
+        prefix = key.rsplit("@", 1)[0] + "@"
+        with self.lock, self.db:
+            self.db.execute(
+                "DELETE FROM units WHERE substr(job_key, 1, ?) = ? AND job_key != ?",
+                (len(prefix), prefix, key),
+            )
+
+    # Result rows ################################################
+    def unit_done(self, key, index, cnr_number=None, since=None):
+        """
+        True if the row was stored (or skipped), at `since` or later if given.
+        """
+        with self.lock:
+            row = self.db.execute(
+                "SELECT cnr_number, finished_at FROM units "
+                "WHERE job_key = ? AND result_index = ?",
+                (key, index),
+            ).fetchone()
+        if row is None or (since is not None and row[1] < since):
+            return False
+        # A different CNR at this index means the result list has shifted
+        return cnr_number is None or row[0] == cnr_number
+
+    def case_unchanged(self, cnr_number):
+        if not cnr_number:
+            return False
+        with self.lock:
+            row = self.db.execute(
+                "SELECT disposed, next_hearing_date FROM cases WHERE cnr_number = ?",
+                (cnr_number,),
+            ).fetchone()
+        if row is None:
+            return False
+        disposed, hearing = row
+        return bool(disposed) or bool(hearing and hearing > date.today().isoformat())
+
+    def finish_unit(self, key, index, case_data):
+        cnr_number = case_data.get("details", {}).get("cnr_number")
+        now = time.time()
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO units VALUES (?, ?, ?, ?)",
+                (key, index, cnr_number, now),
+            )
+            self.units_finished += 1
+            if cnr_number:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO cases VALUES (?, ?, ?, ?)",
+                    (
+                        cnr_number,
+                        int(is_disposed(case_data)),
+                        next_hearing(case_data),
+                        now,
+                    ),
+                )
+
+    def skip_unit(self, key, index, cnr_number):
+        """
+        Marks a row that was skipped as unchanged, so a restart does not even
+        look it up again.
+        """
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO units VALUES (?, ?, ?, ?)",
+                (key, index, cnr_number, time.time()),
+            )
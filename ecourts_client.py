@@ -0,0 +1,413 @@
+"""
+Browserless client for the eCourts case status pages.
+
+Everything the Selenium scraper does after the captcha is a plain XHR POST
+made by the portal's JavaScript (submitCaseType(), viewHistory(),
+viewBusiness(), displayPdf()). EcourtsClient makes the same calls with a
+requests.Session, so one case costs one HTTP connection instead of one
+Chrome process. The session can either bootstrap itself (fetching and solving
+the captcha over HTTP) or borrow the cookies of a Selenium driver.
+
+Setting `record_dir` stores every response on disk so that replay_server.py
+can serve them back for offline testing. network_capture.py records what a
+browser loads in the same format.
+"""
+
+import base64
+import itertools
+import json
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import parse_qsl, urljoin, urlsplit
+
+import requests
+
+from governor import get_governor
+from metrics import count
+from parsing import make_soup, parse_js_call
+
+BASE_URL = "https://services.ecourts.gov.in/ecourtindia_v6/"
+
+# Portal endpoints (the `p` query parameter)
+INDEX = "casestatus/index"
+FILL_DISTRICT = "casestatus/fillDistrict"
+FILL_COMPLEX = "casestatus/fillcomplex"
+SET_DATA = "casestatus/set_data"
+FILL_CASE_TYPE = "casestatus/fillCaseType"
+SUBMIT_CASE_TYPE = "casestatus/submitCaseType"
+SEARCH_CNR = "cnr_status/searchByCNR"
+VIEW_HISTORY = "home/viewHistory"
+VIEW_BUSINESS = "home/viewBusiness"
+DISPLAY_PDF = "home/display_pdf"
+CAPTCHA_IMAGE = "vendor/securimage/securimage_show.php"
+
+# Radio button ids used by the Selenium scraper -> value the portal expects
+CASE_STATUS = {"radPCT": "Pending", "radDCT": "Disposed"}
+
+# Positional arguments of the JS functions behind the result / history links
+VIEW_HISTORY_ARGS = [
+    "case_no",
+    "cino",
+    "court_code",
+    "hideparty",
+    "search_flag",
+    "state_code",
+    "dist_code",
+    "court_complex_code",
+    "search_by",
+]
+VIEW_BUSINESS_ARGS = [
+    "court_code",
+    "dist_code",
+    "nextdate1",
+    "case_number1",
+    "state_code",
+    "disposal_flag",
+    "businessDate",
+    "court_no",
+    "search_by",
+    "srno",
+]
+
+
+logger = logging.getLogger("scraper")
+
+# Orders the recordings of a process; several clients (and the browser
+# recorder) may record into the same directory
+_record_seq = itertools.count(1)
+
+
+class EcourtsError(Exception):
+    pass
+
+
+class CaptchaError(EcourtsError):
+    pass
+
+
+class NoRecordsError(EcourtsError):
+    pass
+
+
+def js_call_params(onclick, names):
+    """
+    Maps the positional arguments of a JS call onto the POST field names.
+    """
+    _, args = parse_js_call(onclick)
+    return dict(zip(names, args))
+
+
+def endpoint_for(url, base_url=BASE_URL):
+    """
+    The endpoint a portal url is recorded under: the `p` parameter or the
+    path below `base_url`, as replay_server.py looks them up. Urls outside
+    the base url are kept whole.
+    """
+    if not url.startswith(base_url):
+        return url
+    rest = urlsplit(url[len(base_url) :])
+    return dict(parse_qsl(rest.query)).get("p") or rest.path
+
+
+def save_recording(record_dir, method, endpoint, data, status, content_type, body):
+    """
+    Stores one response for replay_server.py.
+    """
+    path = os.path.join(
+        record_dir,
+        f"{os.getpid()}-{next(_record_seq):06d}-"
+        f"{re.sub(r'[^A-Za-z0-9]+', '_', endpoint)[-80:]}.json",
+    )
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "method": method,
+                "endpoint": endpoint,
+                "data": data or {},
+                "status": status,
+                "content_type": content_type,
+                "body": base64.b64encode(body).decode("ascii"),
+            },
+            f,
+            indent=1,
+        )
+
+
+def parse_options(html):
+    """
+    {visible text: value} for the <option>s in an HTML fragment.
+    """
+    options = {}
+    for option in make_soup(html).find_all("option"):
+        value = option.get("value", "")
+        text = option.get_text(strip=True)
+        if value and value != "0":
+            options[text] = value
+    return options
+
+
+class EcourtsClient:
+    def __init__(self, base_url=BASE_URL, session=None, timeout=30, record_dir=None):
+        self.base_url = base_url
+        self.session = session or requests.Session()
+        self.timeout = timeout
+        self.record_dir = record_dir
+        self.app_token = ""
+        # Set while concurrent requests have left app_token in no particular
+        # order; cleared by the next response that arrives on its own
+        self.token_stale = False
+        self.location = {}
+
+        if record_dir and not os.path.exists(record_dir):
+            os.makedirs(record_dir)
+
+    @classmethod
+    def from_driver(cls, driver, **kwargs):
+        """
+        Builds a client that reuses the cookies (and app token) of a Selenium
+        session which has already been through the captcha.
+        """
+        client = cls(**kwargs)
+        for cookie in driver.get_cookies():
+            client.session.cookies.set(cookie["name"], cookie["value"])
+        client.app_token = (
+            driver.execute_script(
+                "var el = document.getElementById('app_token');"
+                "return el ? el.value : '';"
+            )
+            or ""
+        )
+        return client
+
+    def sync_driver(self, driver):
+        """
+        Hands the rotated app token back to the Selenium page, so the
+        portal's own XHRs keep working after requests made by this client.
+        A token that may be stale is not handed back.
+        """
+        if self.app_token and not self.token_stale:
+            driver.execute_script(
+                "var el = document.getElementById('app_token');"
+                "if (el) { el.value = arguments[0]; }",
+                self.app_token,
+            )
+
+    # Transport ##################################################
+    def _url(self, endpoint):
+        # Files (captcha script, order PDFs) live under the base url, the
+        # ajax endpoints are routed through the `p` parameter
+        if "." in endpoint.rsplit("/", 1)[-1] or endpoint.startswith("http"):
+            return urljoin(self.base_url, endpoint)
+        return f"{self.base_url}?p={endpoint}"
+
+    def _record(self, method, endpoint, data, response):
+        if not self.record_dir:
+            return
+        save_recording(
+            self.record_dir,
+            method,
+            endpoint,
+            data,
+            response.status_code,
+            response.headers.get("Content-Type", ""),
+            response.content,
+        )
+
+    def get(self, endpoint):
+        response = get_governor().call(
+            self.session.get, self._url(endpoint), timeout=self.timeout
+        )
+        self._record("GET", endpoint, None, response)
+        if response.status_code != 200:
+            raise EcourtsError(f"GET {endpoint} returned {response.status_code}")
+        return response
+
+    def post(self, endpoint, data):
+        """
+        POSTs like the portal's ajax helper and returns the decoded JSON.
+        The app token rotates with every response.
+        """
+        payload = dict(data, ajax_req="true", app_token=self.app_token)
+        response = get_governor().call(
+            self.session.post,
+            self._url(endpoint),
+            data=payload,
+            headers={"X-Requested-With": "XMLHttpRequest"},
+            timeout=self.timeout,
+        )
+        self._record("POST", endpoint, data, response)
+        if response.status_code != 200:
+            raise EcourtsError(f"POST {endpoint} returned {response.status_code}")
+
+        try:
+            result = json.loads(response.text.lstrip("\ufeff"))
+        except ValueError:
+            raise EcourtsError(f"POST {endpoint} did not return JSON")
+
+        if isinstance(result, dict):
+            if "app_token" in result:
+                self.app_token = result["app_token"]
+                self.token_stale = False
+            error = result.get("errormsg") or result.get("error")
+            if error:
+                if "captcha" in str(error).lower():
+                    raise CaptchaError(error)
+                if "record not found" in str(error).lower():
+                    raise NoRecordsError(error)
+                raise EcourtsError(error)
+        return result
+
+    # Search form ################################################
+    def bootstrap(self):
+        """
+        Opens the case status page to get the session cookie and app token.
+        Returns {state name: state code}.
+        """
+        soup = make_soup(self.get(INDEX).text)
+        token = soup.find("input", id="app_token")
+        if token is not None:
+            self.app_token = token.get("value", "")
+        states = soup.find("select", id="sess_state_code")
+        return parse_options(str(states)) if states is not None else {}
+
+    def districts(self, state_code):
+        result = self.post(FILL_DISTRICT, {"state_code": state_code})
+        return parse_options(result.get("dist_list", ""))
+
+    def court_complexes(self, state_code, dist_code):
+        result = self.post(
+            FILL_COMPLEX, {"state_code": state_code, "dist_code": dist_code}
+        )
+        return parse_options(result.get("complex_list", ""))
+
+    def set_location(self, state_code, dist_code, complex_value):
+        """
+        `complex_value` is the option value of the court complex dropdown,
+        e.g. "1070009@2,3,4@N" (complex code @ establishment codes @ flag).
+        """
+        complex_code, est_codes = (complex_value.split("@") + [""])[:2]
+        self.location = {
+            "state_code": state_code,
+            "dist_code": dist_code,
+            "court_complex_code": complex_code,
+            "est_code": est_codes,
+        }
+        self.post(
+            SET_DATA,
+            {
+                "complex_code": complex_value,
+                "selected_state_code": state_code,
+                "selected_dist_code": dist_code,
+                "selected_est_code": est_codes,
+            },
+        )
+
+    def case_types(self):
+        result = self.post(FILL_CASE_TYPE, dict(self.location, search_type="c_no"))
+        return parse_options(result.get("casetype_list", ""))
+
+    def captcha_image(self):
+        """
+        PNG bytes of a fresh captcha for this session.
+        """
+        return self.get(CAPTCHA_IMAGE).content
+
+    def search_case_type(self, case_type, year, case_status, captcha):
+        """
+        The XHR behind submitCaseType(). Returns the results page HTML, ""
+        if the search has no results.
+        """
+        try:
+            result = self.post(
+                SUBMIT_CASE_TYPE,
+                dict(
+                    self.location,
+                    case_type=case_type,
+                    search_year=year,
+                    case_status=CASE_STATUS.get(case_status, case_status),
+                    ct_captcha_code=captcha,
+                ),
+            )
+        except NoRecordsError:
+            return ""
+        return result.get("case_data", "")
+
+    def search_cnr(self, cnr_number, captcha):
+        """
+        CNR number search. Returns the case details HTML of that case.
+        """
+        result = self.post(SEARCH_CNR, {"cino": cnr_number, "fcaptcha_code": captcha})
+        return result.get("casetype_list") or result.get("data_list", "")
+
+    # Case pages #################################################
+    def view_case(self, onclick):
+        """
+        The XHR behind a result row's View link. Returns the case details HTML.
+        """
+        result = self.post(VIEW_HISTORY, js_call_params(onclick, VIEW_HISTORY_ARGS))
+        return result.get("data_list", "")
+
+    def business_on_date(self, onclick):
+        """
+        The XHR behind a hearing date link in the history table.
+        """
+        result = self.post(VIEW_BUSINESS, js_call_params(onclick, VIEW_BUSINESS_ARGS))
+        return result.get("data_list", "")
+
+    def business_on_dates(self, onclicks, workers=4):
+        """
+        business_on_date() for every hearing link of a case, up to `workers`
+        requests at a time. Returns the HTML in the order of `onclicks`
+        ("" where there is no link). Requests that fail while running
+        concurrently are retried one by one; a request that fails again is
+        logged and counted, and its page is left "".
+        """
+        pages = [""] * len(onclicks)
+        todo = [i for i, onclick in enumerate(onclicks) if onclick]
+
+        if workers > 1 and len(todo) > 1:
+            failed = []
+            with ThreadPoolExecutor(max_workers=min(workers, len(todo))) as executor:
+                futures = {
+                    executor.submit(self.business_on_date, onclicks[i]): i for i in todo
+                }
+                for future in as_completed(futures):
+                    i = futures[future]
+                    try:
+                        pages[i] = future.result()
+                    except (EcourtsError, requests.RequestException):
+                        failed.append(i)
+            # The responses rotated the token in whatever order they arrived
+            self.token_stale = True
+            todo = sorted(failed)
+
+        for i in todo:
+            try:
+                pages[i] = self.business_on_date(onclicks[i])
+            except (EcourtsError, requests.RequestException) as e:
+                logger.error(f"Business on date {i + 1} failed: {e}")
+                count("business_failed")
+        return pages
+
+    def order_pdf_url(self, onclick):
+        """
+        Resolves an order link (displayPdf('normal_v=..&case_val=..')) to the
+        absolute url of its PDF, or None if the portal has no file for it.
+        """
+        _, args = parse_js_call(onclick)
+        if not args:
+            return None
+        result = self.post(DISPLAY_PDF, dict(parse_qsl(args[0])))
+        pdf_path = result.get("order") if isinstance(result, dict) else None
+        if not pdf_path:
+            return None
+        return self._url(pdf_path)
+
+    def order_pdf(self, onclick):
+        """
+        PDF bytes behind an order link, or None.
+        """
+        url = self.order_pdf_url(onclick)
+        return self.get(url).content if url else None
@@ -0,0 +1,241 @@
+"""
+One request governor for everything sent to the portal.
+
+Page loads, XHRs and PDF fetches all go through RequestGovernor.call(), which
+combines
+
+* a token bucket: at most `rate` requests per second, in bursts of `burst`,
+* an AIMD concurrency limit: every fast success raises the limit by 1/limit
+  (and the rate a little), every 429/5xx or slow response halves both,
+* jittered exponential retries of throttled and failed requests, honouring
+  the portal's Retry-After.
+
+Throughput climbs to whatever the portal tolerates and backs off as soon as it
+pushes back. Limits are per process; each pool worker has its own governor.
+replay_server.py can inject 429/503 responses and latency to exercise it.
+"""
+
+import logging
+import random
+import threading
+import time
+
+import requests
+
+from metrics import count
+
+logger = logging.getLogger("scraper")
+
+# Status codes the portal answers with when it is overloaded
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Settings of the process wide governor (see configure())
+SETTINGS = {}
+
+_governor = None
+_lock = threading.Lock()
+
+
+class RetryableError(Exception):
+    """
+    A request that may succeed when tried again. `throttled` marks errors that
+    mean the portal is pushing back.
+    """
+
+    def __init__(self, message, throttled=False, retry_after=None):
+        super().__init__(message)
+        self.throttled = throttled
+        self.retry_after = retry_after
+
+
+def retry_after(response):
+    """
+    Seconds from a Retry-After header, or None.
+    """
+    try:
+        return float(response.headers.get("Retry-After", ""))
+    except (AttributeError, ValueError):
+        return None
+
+
+class RequestGovernor:
+    def __init__(
+        self,
+        rate=5.0,
+        burst=10,
+        max_concurrency=8,
+        min_rate=0.2,
+        slow_after=15.0,
+        max_retries=4,
+        backoff=1.0,
+        max_backoff=60.0,
+    ):
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.slow_after = slow_after
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.rate = rate
+        self.limit = float(max_concurrency)
+        self.tokens = float(burst)
+        self.in_flight = 0
+
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+        self.decreases = 0
+
+        self._updated = time.monotonic()
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    # Limits #####################################################
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _acquire(self):
+        """
+        Blocks until a concurrency slot and a token are free.
+        """
+        with self._cond:
+            while True:
+                wait = None
+                if self.in_flight < int(self.limit):
+                    self._refill()
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        self.in_flight += 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                self._cond.wait(wait)
+
+    def _release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self.calls += 1
+            self._cond.notify_all()
+
+    def _increase(self):
+        with self._cond:
+            self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 50)
+            self._cond.notify_all()
+
+    def _decrease(self, reason):
+        with self._cond:
+            # Requests in flight together fail together; back off once for them
+            now = time.monotonic()
+            if now - self._last_decrease < 1.0:
+                return
+            self._last_decrease = now
+            self.limit = max(1.0, self.limit / 2)
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.decreases += 1
+        logger.info(
+            f"Portal {reason}, backing off to {self.rate:.2f} req/s, "
+            f"{int(self.limit)} concurrent"
+        )
+
+    # Requests ###################################################
+    def call(self, fn, *args, retry_on=(), **kwargs):
+        """
+        Runs fn(*args, **kwargs) within the limits and returns its result.
+
+        Responses with a RETRY_STATUS, RetryableError, connection errors and
+        the exceptions in `retry_on` are retried with jittered exponential
+        backoff. Once the retries are used up the last error is raised, or the
+        last response returned.
+        """
+        retryable = (RetryableError, requests.ConnectionError, requests.Timeout)
+        retryable += tuple(retry_on)
+
+        for attempt in range(self.max_retries + 1):
+            self._acquire()
+            start = time.perf_counter()
+            error = result = None
+            try:
+                result = fn(*args, **kwargs)
+            except retryable as e:
+                error = e
+            finally:
+                self._release()
+            elapsed = time.perf_counter() - start
+
+            status = getattr(result, "status_code", None)
+            if error is None and status not in RETRY_STATUS:
+                if elapsed > self.slow_after:
+                    self._decrease(f"slow ({elapsed:.1f}s)")
+                else:
+                    self._increase()
+                return result
+
+            if error is None:
+                throttled, delay = True, retry_after(result)
+                reason = f"returned {status}"
+            else:
+                throttled = getattr(error, "throttled", False)
+                delay = getattr(error, "retry_after", None)
+                reason = f"failed ({error})"
+            if throttled:
+                with self._cond:
+                    self.throttled += 1
+                count("requests_throttled")
+            if throttled or elapsed > self.slow_after:
+                self._decrease(reason)
+
+            if attempt == self.max_retries:
+                if error is not None:
+                    raise error
+                return result
+
+            if result is not None and hasattr(result, "close"):
+                result.close()
+            if delay is None:
+                # Full jitter
+                delay = random.uniform(
+                    0, min(self.max_backoff, self.backoff * 2**attempt)
+                )
+            with self._cond:
+                self.retries += 1
+            count("requests_retried")
+            logger.info(f"Request {reason}, retry {attempt + 1} in {delay:.1f}s")
+            time.sleep(delay)
+
+    def report(self):
+        return (
+            f"Requests: {self.calls} sent, {self.retries} retried, "
+            f"{self.throttled} throttled, now {self.rate:.2f} req/s "
+            f"x {int(self.limit)} concurrent"
+        )
+
+
+def configure(**settings):
+    """
+    Sets the RequestGovernor arguments of this process. The governor is
+    rebuilt on next use if they changed.
+    """
+    global _governor
+
+    with _lock:
+        if settings != SETTINGS:
+            SETTINGS.clear()
+            SETTINGS.update(settings)
+            _governor = None
+
+
+def get_governor():
+    """
+    The process wide governor, created on first use.
+    """
+    global _governor
+
+    with _lock:
+        if _governor is None:
+            _governor = RequestGovernor(**SETTINGS)
+        return _governor
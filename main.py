@@ -1,24 +1,56 @@
+import argparse
 import logging.config
 import os
-import re
+import socket
 import time
-import uuid
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
+from functools import partial
+from multiprocessing.util import Finalize
 
-import pytesseract
 import requests
-from azure.storage.blob import BlobServiceClient
 from dotenv import load_dotenv
-from PIL import Image
-from pymongo import MongoClient
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.select import Select
-from selenium.webdriver.support.ui import WebDriverWait
 
-pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+import metrics
+from archive import PageArchive, reparse
+from blob_storage import blob_name_from_url, reset_blob_client, upload_pdf_bytes
+from checkpoints import CheckpointStore, job_key, unit_key
+from ecourts_client import (
+    BASE_URL,
+    CaptchaError,
+    EcourtsClient,
+    endpoint_for,
+    save_recording,
+)
+from governor import configure as configure_governor
+from governor import get_governor
+from metrics import count, observe, set_labels, timed
+from parsing import (
+    date_formate1,
+    date_formate2,
+    next_hearing_at,
+    parse_business_on_date,
+    parse_case_details,
+    parse_case_links,
+    parse_results_page,
+)
+from pdf_pipeline import PdfPipeline
+from pdf_text import blob_text, text_pool
+from refresh import order_key, refresh_cases
+from scheduler import JobQueue, PortalCatalog, describe, expand_jobs, load_config
+from waits import (
+    CAPTCHA_REJECTED,
+    NO_RECORDS,
+    WAIT_STATS,
+    attribute_changed,
+    dismiss_validate_error,
+    image_loaded,
+    merge_wait_stats,
+    print_wait_report,
+    search_outcome,
+    wait_for,
+)
 
 load_dotenv()
 
@@ -49,8 +81,8 @@ logging.config.dictConfig(
                 "formatter": "verbose",
             },
         },
-        "scraper": {
-            "authentication": {
+        "loggers": {
+            "scraper": {
                 "handlers": ["file_scraper"],
                 "level": "DEBUG",
                 "propagate": False,
@@ -62,59 +94,248 @@ logging.config.dictConfig(
 logger = logging.getLogger("scraper")
 
 # Setting up mongo db client #####################################
-client = MongoClient(os.getenv("MONGO_URI"))
+# Selenium, pymongo, Tesseract and the Azure SDK are imported by the code that
+# uses them and every client is created on first use, so importing this module
+# (as every spawned pool process does) needs neither the packages of other
+# modes nor running services.
+MONGO_CLIENT = None
 
-db = client[os.getenv("MONGO_DB_NAME")]
-collection = db[os.getenv("MONGO_COLLECTION_NAME")]
 
+def get_db():
+    """
+    The Mongo database of this process, connected on first use.
+    """
+    global MONGO_CLIENT
 
-date_formate1 = lambda date: datetime.strftime(
-    datetime.strptime(date, "%d-%m-%Y"), "%d/%m/%Y"
-)
+    if MONGO_CLIENT is None:
+        from pymongo import MongoClient
 
+        MONGO_CLIENT = MongoClient(os.getenv("MONGO_URI"))
+    return MONGO_CLIENT[os.getenv("MONGO_DB_NAME")]
 
-def date_formate2(string: str):
-    pattern = r"(\d{1,2})(?:th|st|nd|rd)?\s+([A-Za-z]+)\s+(\d{4})"
-    match = re.search(pattern, string)
-    if match:
-        day = match.group(1)
-        month = match.group(2)
-        year = match.group(3)
-        month_number = datetime.strptime(month, "%B").month
-        extracted_date = datetime(
-            year=int(year), month=month_number, day=int(day)
-        ).date()
-        return extracted_date.strftime("%d/%m/%Y")
-    else:
-        return None
 
+def get_collection():
+    return get_db()[os.getenv("MONGO_COLLECTION_NAME")]
+
+
+# Background PdfPipeline of the current job (None = download PDFs inline)
+PDF_PIPELINE = None
+
+# Raw page archive of the current job (--archive, see archive.py)
+ARCHIVE = None
+
+# Browser session of this process, reused by every job it runs
+BROWSER_SESSION = None
+
+# Checkpoints of the current job (see checkpoints.py)
+CHECKPOINTS = None
+CHECKPOINT_FILE = "checkpoints.sqlite3"
+
+# Crawl of the current job when it came from the shared queue (--queue)
+CRAWL = None
+
+# Take order PDFs from the browser's network traffic (--capture-pdfs)
+CAPTURE_PDFS = False
 
-def download_pdf_with_cookies(pdf_url, driver, file_path):
+# Concurrent business on date requests per case (0 = skip them)
+BUSINESS_WORKERS = 4
+
+# Portal the requests made next to the browser go to (--base-url), and where
+# their responses are recorded (--record)
+PORTAL_BASE_URL = BASE_URL
+RECORD_DIR = None
+
+# Where cases are written: the buffered Mongo writer, or with --sink a local
+# file sink (see sinks.py). Created on first write.
+SINK = None
+SINK_SPEC = None  # (kind, directory) of --sink
+MONGO_BATCH_SIZE = int(os.getenv("MONGO_BATCH_SIZE", "100"))
+MONGO_FLUSH_INTERVAL = float(os.getenv("MONGO_FLUSH_INTERVAL", "5"))
+
+
+def download_pdf_with_cookies(pdf_url, driver):
     """
     Download a PDF via requests, copying session cookies from Selenium's driver.
     This ensures the server sees the same authenticated session and doesn't return 404.
+    Returns the PDF bytes (the blob name is their hash), or None.
     """
     session = requests.Session()
     for cookie in driver.get_cookies():
         session.cookies.set(cookie["name"], cookie["value"])
-    resp = session.get(pdf_url, stream=True)
+    with session:
+        resp = get_governor().call(session.get, pdf_url, timeout=60)
+    record_response(pdf_url, resp)
     if resp.status_code == 200:
-        with open(file_path, "wb") as f:
-            for chunk in resp.iter_content(chunk_size=1024):
-                if chunk:
-                    f.write(chunk)
-        return True
+        return resp.content
     else:
-        return False
+        logger.error(f"PDF download {pdf_url} returned {resp.status_code}")
+        return None
+
+
+def record_response(url, resp):
+    """
+    Stores a response fetched next to the browser for replay (--record).
+    """
+    if RECORD_DIR:
+        save_recording(
+            RECORD_DIR,
+            "GET",
+            endpoint_for(url, PORTAL_BASE_URL),
+            None,
+            resp.status_code,
+            resp.headers.get("Content-Type", ""),
+            resp.content,
+        )
+
+
+def fetch_order_pdf(driver, link, order_info, case_data):
+    """
+    Opens the order modal behind `link`, stores the order PDF and sets
+    order_info["url"]. The modal is always closed again.
+    """
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+
+    import network_capture
+
+    start = time.perf_counter()
+    try:
+        if CAPTURE_PDFS:
+            # Only the PDF of this modal is of interest in the network log
+            network_capture.discard_events(driver)
+
+        # Click the link to open the modal
+        driver.execute_script("arguments[0].click();", link)
+
+        # Locate <object> with PDF URL once the modal is open
+        object_tag = wait_for(
+            driver,
+            "order_modal",
+            EC.presence_of_element_located(
+                (By.CSS_SELECTOR, "#modal_order_body object[data]")
+            ),
+        )
+        pdf_path = object_tag.get_attribute("data")  # or "src"
+
+        data = None
+        if pdf_path and CAPTURE_PDFS:
+            # The browser already loaded the PDF into the modal; keep its bytes
+            data = network_capture.pdf_bytes(driver, pdf_path)
+            if data is None:
+                count("pdf_redownloaded")
+
+        if data is not None:
+            observe("order_pdf", time.perf_counter() - start)
+            if PDF_PIPELINE is not None:
+                PDF_PIPELINE.stage(order_info, pdf_path, {}, data=data)
+            else:
+                order_info["url"] = store_pdf_bytes(data, case_data["details"]) or ""
+
+        elif pdf_path and PDF_PIPELINE is not None:
+            # Hand the PDF to the background uploaders and move on
+            cookies = {c["name"]: c["value"] for c in driver.get_cookies()}
+            PDF_PIPELINE.stage(order_info, pdf_path, cookies)
+
+        # If there's a PDF link, download it in memory and upload it
+        elif pdf_path:
+            data = download_pdf_with_cookies(pdf_path, driver)
+            observe("order_pdf", time.perf_counter() - start)
+            if data:
+                order_info["url"] = store_pdf_bytes(data, case_data["details"]) or ""
+            else:
+                order_info["url"] = ""
+    except Exception as ex:
+        logger.error(f"Error downloading PDF for order {order_info['date']}: {str(ex)}")
+    finally:
+        # Close the modal
+        try:
+            close_button = wait_for(
+                driver,
+                "order_close",
+                EC.element_to_be_clickable(
+                    (
+                        By.XPATH,
+                        "//button[contains(text(),'Close') or contains(@class,'btn-close')]",
+                    )
+                ),
+            )
+            close_button.click()
+            wait_for(
+                driver,
+                "order_close",
+                EC.invisibility_of_element_located((By.ID, "modal_order_body")),
+            )
+        except Exception:
+            pass
+
+
+def fill_business_on_date(http, history, onclicks):
+    """
+    Fetches the business on date of every hearing straight from the portal,
+    BUSINESS_WORKERS requests at a time, into history[i]["business_on_date"].
+    With --skip-business the entries are left empty.
+    """
+    if not BUSINESS_WORKERS:
+        blank_business_on_date(history)
+        return
+
+    with timed("history"):
+        pages = http.business_on_dates(onclicks, workers=BUSINESS_WORKERS)
+        if ARCHIVE is not None:
+            ARCHIVE.stage_business(pages)
+        for entry, html in zip(history, pages):
+            entry["business_on_date"] = parse_business_on_date(html) if html else {}
+
+
+def blank_business_on_date(history):
+    """
+    Empty business on date for the history rows that did not get one.
+    """
+    for entry in history:
+        entry.setdefault("business_on_date", {})
+
+
+def fill_business_on_date_browser(driver, history, onclicks):
+    """
+    fill_business_on_date over the cookies of the browser session, instead
+    of clicking every hearing link open and closed.
+    """
+    if not BUSINESS_WORKERS:
+        fill_business_on_date(None, history, onclicks)
+        return
+
+    http = EcourtsClient.from_driver(
+        driver, base_url=PORTAL_BASE_URL, record_dir=RECORD_DIR
+    )
+    try:
+        fill_business_on_date(http, history, onclicks)
+    finally:
+        http.sync_driver(driver)
+        http.session.close()
 
 
 def extract_case_details(driver):
     """
     Extracts case info, downloads the PDFs, and returns a dictionary with all case data.
     """
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+
+    if PDF_PIPELINE is not None:
+        PDF_PIPELINE.begin_case()
     case_data = {}
+    start = time.perf_counter()
     try:
-        time.sleep(2)  # Let the details page load
+        # Let the details page load
+        wait_for(
+            driver,
+            "case_details",
+            EC.visibility_of_element_located(
+                (By.CSS_SELECTOR, "table.case_details_table")
+            ),
+        )
+        if ARCHIVE is not None:
+            ARCHIVE.stage_case(driver.page_source)
 
         # Case details table
         # Case type
@@ -218,12 +439,16 @@ def extract_case_details(driver):
         except:
             case_data["acts"] = []
 
+        observe("case_details", time.perf_counter() - start)
+
         # Case History
+        case_data["history"] = []
         try:
             history_rows = driver.find_elements(
                 By.CSS_SELECTOR, "table.history_table tbody tr"
             )
             case_history = []
+            business_links = []
 
             for row in history_rows:
                 temp = {}
@@ -240,55 +465,18 @@ def extract_case_details(driver):
                         cells[3].text.strip() if cells[3].text else ""
                     )
 
-                    # getting business details
-                    link = cells[1].find_element(By.TAG_NAME, "a")
-                    driver.execute_script("arguments[0].click();", link)
-                    time.sleep(1)
-
-                    WebDriverWait(driver, 10).until(
-                        EC.presence_of_element_located(
-                            (By.CSS_SELECTOR, "div#caseBusinessDiv_caseType")
-                        )
-                    )
-
-                    business_rows = driver.find_elements(
-                        By.CSS_SELECTOR,
-                        "div#caseBusinessDiv_caseType div center center table tr",
+                    # business on date is fetched for all rows at once below
+                    link = cells[1].find_elements(By.TAG_NAME, "a")
+                    business_links.append(
+                        link[0].get_attribute("onclick") if link else None
                     )
-                    temp2 = {}
-                    for row2 in business_rows[1:]:
-                        try:
-                            cells2 = row2.find_elements(By.TAG_NAME, "td")
-                            label = cells2[0].text.strip()
-                            if "Business" in label:
-                                temp2["business"] = cells2[2].text.strip()
-                            elif "Next Purpose" in label:
-                                temp2["next_purpose"] = cells2[2].text.strip()
-                            elif "Next Hearing Date" in label:
-                                temp2["next_hearing_date"] = cells2[2].text.strip()
-                            elif "Nature of Disposal" in label:
-                                temp2["nature_of_disposal"] = cells2[2].text.strip()
-                            elif "Disposal Date" in label:
-                                temp2["disposal_date"] = cells2[2].text.strip()
-                        except Exception as e:
-                            print(e)
-                            continue
-
-                    driver.execute_script("back_fun('CScaseType')")
-
-                    WebDriverWait(driver, 10).until(
-                        EC.invisibility_of_element_located(
-                            (By.ID, "caseBusinessDiv_caseType")
-                        )
-                    )
-
-                    temp["business_on_date"] = temp2
                     case_history.append(temp)
 
             case_data["history"] = case_history
+            fill_business_on_date_browser(driver, case_history, business_links)
         except Exception as e:
             logger.error(f"Exception: {e}")
-            case_data["history"] = []
+            blank_business_on_date(case_data["history"])
 
         # Orders
         orders = []
@@ -305,54 +493,9 @@ def extract_case_details(driver):
                             "date": cells[1].text.strip(),
                             "detail": cells[2].text.strip(),
                         }
-                        try:
-                            # Click the link to open the modal
-                            link = cells[2].find_element(By.TAG_NAME, "a")
-                            driver.execute_script("arguments[0].click();", link)
-                            time.sleep(1)  # let modal open
-
-                            # Locate <object> with PDF URL
-                            modal_body = driver.find_element(By.ID, "modal_order_body")
-                            object_tag = modal_body.find_element(By.TAG_NAME, "object")
-                            pdf_path = object_tag.get_attribute("data")  # or "src"
-
-                            # If there's a PDF link, rename by date (avoid invalid chars)
-                            if pdf_path:
-                                # Create a safe filename from the order_date + order_number
-                                filename = f"{uuid.uuid4().hex}.pdf"
-                                save_path = os.path.join("pdf", filename)
-
-                                is_downloaded = download_pdf_with_cookies(
-                                    pdf_path, driver, save_path
-                                )
-                                if is_downloaded:
-                                    new_url = upload_pdf_to_azure(
-                                        save_path, case_data["details"]
-                                    )
-                                    clean_up(save_path)
-                                else:
-                                    new_url = ""
-
-                                order_info["url"] = new_url
-                        except Exception as ex:
-                            logger.error(
-                                f"Error downloading PDF for order {order_info['order_number']}: {str(ex)}"
-                            )
-                        finally:
-                            # Close the modal
-                            try:
-                                close_button = WebDriverWait(driver, 5).until(
-                                    EC.element_to_be_clickable(
-                                        (
-                                            By.XPATH,
-                                            "//button[contains(text(),'Close') or contains(@class,'btn-close')]",
-                                        )
-                                    )
-                                )
-                                close_button.click()
-                                time.sleep(1)
-                            except Exception:
-                                pass
+                        links = cells[2].find_elements(By.TAG_NAME, "a")
+                        if links:
+                            fetch_order_pdf(driver, links[0], order_info, case_data)
 
                         orders.append(order_info)
             case_data["orders"] = orders
@@ -366,205 +509,1112 @@ def extract_case_details(driver):
         return case_data
 
 
-def save_to_mongodb(data):
-    collection.insert_one(data)
+# Link elements in the same order parse_orders emits its rows
+ORDER_LINKS_JS = """
+return Array.from(document.querySelectorAll('table.order_table'))
+    .flatMap(t => Array.from(t.querySelectorAll('tr')).slice(1))
+    .map(r => r.querySelectorAll('td'))
+    .filter(cells => cells.length >= 3)
+    .map(cells => cells[2].querySelector('a'));
+"""
 
 
-def upload_pdf_to_azure(file_path, details):
+def extract_case_details_snapshot(driver):
+    """
+    Same result as extract_case_details, but the page is read once through
+    driver.page_source and parsed in-process. The browser is only used for
+    the order modals.
+    """
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+
+    if PDF_PIPELINE is not None:
+        PDF_PIPELINE.begin_case()
+    case_data = {}
     try:
-        blob_name = file_path.split("/")[-1]
-        blob_service_client = BlobServiceClient.from_connection_string(
-            os.getenv("AZURE_CONNECTION_STRING")
-        )
-        blob_client = blob_service_client.get_blob_client(
-            container=os.getenv("AZURE_CONTAINER_NAME"), blob=blob_name
-        )
-        if blob_client.exists():
-            blob_client.delete_blob()
-        with open(file_path, "rb") as data:
-            blob_client.upload_blob(data, overwrite=True)
-        return blob_client.url
+        with timed("case_details"):
+            wait_for(
+                driver,
+                "case_details",
+                EC.visibility_of_element_located(
+                    (By.CSS_SELECTOR, "table.case_details_table")
+                ),
+            )
+            html = driver.page_source
+            case_data = parse_case_details(html)
+        if ARCHIVE is not None:
+            ARCHIVE.stage_case(html)
+
+        # Business on date for every history row
+        try:
+            fill_business_on_date_browser(
+                driver, case_data["history"], parse_case_links(html)["business"]
+            )
+        except Exception as e:
+            logger.error(f"Exception: {e}")
+            blank_business_on_date(case_data["history"])
+
+        # Orders
+        try:
+            links = driver.execute_script(ORDER_LINKS_JS)
+            for order_info, link in zip(case_data["orders"], links):
+                if link is not None:
+                    fetch_order_pdf(driver, link, order_info, case_data)
+        except Exception as e:
+            logger.error(f"Error processing orders: {str(e)}")
+
+        return case_data
+
     except Exception as e:
-        logger.error(
-            f"Error while uploading {file_path} of case {details} to azure: {e}"
-        )
+        logger.error(f"Error in extract_case_details_snapshot: {str(e)}")
+        return case_data
+
+
+def get_sink():
+    """
+    The case writer of this process, created on first write.
+    """
+    global SINK
+
+    if SINK is None:
+        if SINK_SPEC is not None:
+            from sinks import open_sink
+
+            SINK = open_sink(*SINK_SPEC)
+        else:
+            from mongo_writer import BulkWriter
+
+            SINK = BulkWriter(
+                get_collection(),
+                batch_size=MONGO_BATCH_SIZE,
+                flush_interval=MONGO_FLUSH_INTERVAL,
+            )
+    return SINK
+
+
+def save_to_mongodb(data, on_stored=None):
+    """
+    Upserts the case on its CNR number through the buffered writer (or
+    appends it to the --sink files). False if the case has no CNR number.
+    """
+    return get_sink().write(data, on_stored=on_stored)
+
+
+def save_case(case_data, on_stored=None):
+    """
+    Stores a scraped case and releases its order PDFs to the background
+    pipeline (their urls are patched in once uploaded).
+    """
+    # Used by --refresh to pick the cases that are due
+    case_data["next_hearing_at"] = next_hearing_at(case_data.get("status", {}))
+    case_data["scraped_at"] = datetime.now()
+    if not save_to_mongodb(case_data, on_stored=on_stored):
+        # Its result row stays unchecked, so the next run tries it again
+        return
+    count("cases_stored")
+    if PDF_PIPELINE is not None:
+        PDF_PIPELINE.commit(case_data)
+    if ARCHIVE is not None:
+        try:
+            ARCHIVE.commit(case_data)
+        except Exception as e:
+            logger.error(f"Error archiving case pages: {e}")
+
+
+def patch_order_url(cnr_number, index, url):
+    get_sink().patch(cnr_number, {f"orders.{index}.url": url})
+
+
+def upload_pdf_stream_to_azure(stream, details):
+    """
+    Uploads a PDF read from a stream (e.g. an HTTP response body). The whole
+    body is read into memory first, since the blob name is its content hash.
+    """
+    try:
+        data = stream.read()
+        with timed("blob_upload"):
+            return upload_pdf_bytes(data)
+    except Exception as e:
+        logger.error(f"Error while streaming PDF of case {details} to azure: {e}")
         return None
 
 
-def clean_up(path):
-    if os.path.exists(path):
-        os.remove(path)
+def store_pdf_bytes(data, details):
+    """
+    Uploads PDF bytes held in memory. Returns the blob url.
+    """
+    try:
+        with timed("blob_upload"):
+            return upload_pdf_bytes(data)
+    except Exception as e:
+        logger.error(f"Error while uploading PDF of case {details} to azure: {e}")
+        return None
 
 
 # ----------------------- MAIN SCRIPT -----------------------
-if __name__ == "__main__":
-    state = "Delhi"
-    district = "East"
-    court_complex = "Karkardooma Court Complex"
-    url = "https://services.ecourts.gov.in/"
+# Crawled when no --config is given
+STATE = "Delhi"
+DISTRICT = "East"
+COURT_COMPLEX = "Karkardooma Court Complex"
+URL = "https://services.ecourts.gov.in/"
+
+CASE_TYPE_OPTIONS = [
+    "CS (COMM) - CIVIL SUIT (COMMERCIAL)",
+    "EX - EXECUTION",
+    "MISC DJ - MISC. CASES FOR DJ ADJ",
+    "OMP (COMM) - COMMERCIAL ARBITRATION U/S 34",
+    "OMP (I)(COMM.) - Commercial Arbitration U/s 9",
+]
+
+# radDCT = Disposed, radPCT = Pending
+CASE_STATUS_BUTTONS = ["radDCT", "radPCT"]
 
-    # Ensure PDF folder exists
-    if not os.path.exists("pdf"):
-        os.makedirs("pdf")
+SEARCH_YEAR = "2024"
+
+
+DEFAULT_CRAWL = {
+    "courts": {STATE: {DISTRICT: [COURT_COMPLEX]}},
+    "case_types": CASE_TYPE_OPTIONS,
+    "years": [SEARCH_YEAR],
+    "statuses": CASE_STATUS_BUTTONS,
+}
+
+# Mongo collection of the shared job queue (--queue)
+QUEUE_COLLECTION = os.getenv("MONGO_QUEUE_COLLECTION", "crawl_jobs")
+
+# Mongo collection caching the text of order PDFs by blob name (--extract-text)
+TEXT_COLLECTION = os.getenv("MONGO_TEXT_COLLECTION", "order_texts")
+
+
+def build_jobs(settings):
+    """
+    Expands the crawl config (--config, default DEFAULT_CRAWL) into
+    independent search jobs. With --shards N every search becomes N jobs that
+    each scrape every N-th row of the same result list.
+    """
+    config = load_config(settings.config) if settings.config else DEFAULT_CRAWL
+    if settings.years:
+        config = dict(config, years=settings.years)
+    catalog = PortalCatalog(EcourtsClient(base_url=settings.base_url))
+    return expand_jobs(config, catalog, shards=max(1, settings.shards))
+
+
+def create_driver(headless=False, capture=False, record_dir=None):
+    """
+    A new Chrome. `capture` reads order PDFs from its network traffic,
+    `record_dir` records everything it loads (nothing is blocked then).
+    """
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+
+    import network_capture
 
-    # Initialize the browser
     chrome_options = Options()
-    chrome_options.add_argument("--headless=new")
+    if headless:
+        chrome_options.add_argument("--headless=new")
+    if capture or record_dir:
+        network_capture.enable_logging(chrome_options)
+    driver = webdriver.Chrome(options=chrome_options)
+    if capture or record_dir:
+        network_capture.enable(driver, block=not record_dir)
+    if record_dir:
+        network_capture.start_recording(record_dir)
+    return driver
+
+
+def get_browser_session(settings):
+    """
+    The browser session of this process, created on first use and kept open
+    across jobs. It is closed when the process exits.
+    """
+    global BROWSER_SESSION
+
+    if BROWSER_SESSION is None:
+        from browser_session import BrowserSession
+
+        BROWSER_SESSION = BrowserSession(
+            partial(
+                create_driver,
+                headless=settings.headless,
+                capture=settings.capture_pdfs,
+                record_dir=settings.record,
+            ),
+            # A replay_server.py fixture serves the portal at its root
+            URL if settings.base_url == BASE_URL else settings.base_url,
+        )
+        Finalize(BROWSER_SESSION, BROWSER_SESSION.quit, exitpriority=10)
+    return BROWSER_SESSION
 
-    driver = webdriver.Chrome()
-    wait = WebDriverWait(driver, 20)
 
-    case_type_options = [
-        "CS (COMM) - CIVIL SUIT (COMMERCIAL)",
-        "EX - EXECUTION",
-        "MISC DJ - MISC. CASES FOR DJ ADJ",
-        "OMP (COMM) - COMMERCIAL ARBITRATION U/S 34",
-        "OMP (I)(COMM.) - Commercial Arbitration U/s 9",
-    ]
+def init_worker(governor_settings=None):
+    """
+    Runs once in every pool process. Each worker gets its own Mongo and blob clients
+    (clients must not be shared across a fork) and its own request governor.
+    """
+    global MONGO_CLIENT, SINK
 
-    for case_type_option in case_type_options:
-        for button_id in ["radDCT", "radPCT"]:
-            try:
-                driver.get(url)
-                time.sleep(3)
+    configure_governor(**(governor_settings or {}))
 
-                # Click "Case Status"
-                element = wait.until(
-                    EC.element_to_be_clickable((By.ID, "leftPaneMenuCS"))
-                )
-                element.click()
-                time.sleep(2)
+    MONGO_CLIENT = None
+    SINK = None
 
-                # State
-                state_dropdown = Select(
-                    wait.until(
-                        EC.presence_of_element_located((By.ID, "sess_state_code"))
-                    )
-                )
-                state_dropdown.select_by_visible_text(state)
-                time.sleep(3)
+    reset_blob_client()
 
-                # District
-                dist_dropdown = Select(
-                    wait.until(
-                        EC.presence_of_element_located((By.ID, "sess_dist_code"))
-                    )
-                )
-                dist_dropdown.select_by_visible_text(district)
-                time.sleep(3)
 
-                # Court complex
-                court_dropdown = Select(
-                    wait.until(
-                        EC.presence_of_element_located((By.ID, "court_complex_code"))
-                    )
-                )
-                court_dropdown.select_by_visible_text(court_complex)
-                time.sleep(2)
-
-                # Close any "validateError" modal if present
-                try:
-                    driver.execute_script("closeModel({modal_id:'validateError'})")
-                    time.sleep(2)
-                except:
-                    pass
-
-                # Case type button
-                case_type_button = wait.until(
-                    EC.element_to_be_clickable((By.ID, "casetype-tabMenu"))
-                )
-                case_type_button.click()
-                time.sleep(3)
+def submit_search_with_captcha(driver):
+    """
+    Solves the captcha in memory and submits the search. A rejected captcha
+    is refreshed and solved again, up to captcha_solver.MAX_ATTEMPTS times.
+    Returns the "total cases" element of the results page, or NO_RECORDS
+    if the search has no results.
+    """
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
 
-                # Select "CS (COMM) - CIVIL SUIT (COMMERCIAL)"
-                case_type_dropdown = Select(
-                    wait.until(EC.presence_of_element_located((By.ID, "case_type_2")))
-                )
-                case_type_dropdown.select_by_visible_text(case_type_option)
+    from captcha_solver import MAX_ATTEMPTS as MAX_CAPTCHA_ATTEMPTS
+    from captcha_solver import solve as solve_captcha
 
-                # Year input
-                year_input = wait.until(
-                    EC.presence_of_element_located((By.ID, "search_year"))
-                )
-                year_input.clear()
-                year_input.send_keys("2024")
-
-                # Close any leftover modal
-                try:
-                    driver.execute_script("closeModel({modal_id:'validateError'})")
-                    time.sleep(2)
-                except:
-                    pass
-
-                # Select "Disposed" radio button
-                disposed_radio_button = wait.until(
-                    EC.element_to_be_clickable((By.ID, button_id))
-                )
-                driver.execute_script("arguments[0].click();", disposed_radio_button)
-                time.sleep(2)
+    for attempt in range(1, MAX_CAPTCHA_ATTEMPTS + 1):
+        captcha_image_element = wait_for(
+            driver, "captcha", image_loaded((By.ID, "captcha_image"))
+        )
+        captcha_src = captcha_image_element.get_attribute("src")
+        with timed("captcha"):
+            captcha_text = solve_captcha(captcha_image_element.screenshot_as_png)
+        count("captcha_attempts")
+
+        captcha_input = wait_for(
+            driver,
+            "captcha",
+            EC.presence_of_element_located((By.ID, "ct_captcha_code")),
+        )
+        captcha_input.clear()
+        captcha_input.send_keys(captcha_text)
+
+        # Submit
+        with timed("search_submit"):
+            driver.execute_script("submitCaseType();")
+            outcome = wait_for(
+                driver,
+                "results",
+                search_outcome((By.XPATH, "//div[@id='showList2']/div[2]/a")),
+            )
+        if outcome != CAPTCHA_REJECTED:
+            return outcome
+
+        count("captcha_rejected")
+        logger.info(f"Captcha {captcha_text!r} rejected (attempt {attempt})")
+        dismiss_validate_error(driver)
+        driver.execute_script("refreshCaptcha();")
+        wait_for(
+            driver,
+            "captcha",
+            attribute_changed((By.ID, "captcha_image"), "src", captcha_src),
+        )
 
-                # Solve Captcha
-                captcha_image_element = wait.until(
-                    EC.presence_of_element_located((By.ID, "captcha_image"))
-                )
-                captcha_image_element.screenshot("temp.png")
-                captcha_image = Image.open("temp.png")
-                captcha_text = pytesseract.image_to_string(captcha_image)
+    raise CaptchaError(f"Captcha rejected {MAX_CAPTCHA_ATTEMPTS} times")
 
-                captcha_input = wait.until(
-                    EC.presence_of_element_located((By.ID, "ct_captcha_code"))
-                )
-                captcha_input.clear()
-                captcha_input.send_keys(captcha_text)
 
-                # Submit
-                driver.execute_script("submitCaseType();")
-                time.sleep(5)
+def skip_result(key, index, cnr_number, settings):
+    """
+    True if the index-th result of a job was already stored in this crawl, or
+    its case is stored and cannot have changed. With --force only rows stored
+    by this run count.
+    """
+    since = settings.started_at if settings.force else None
+    if CHECKPOINTS.unit_done(key, index, cnr_number, since=since):
+        count("cases_skipped")
+        return True
+    if not settings.force and CHECKPOINTS.case_unchanged(cnr_number):
+        CHECKPOINTS.skip_unit(key, index, cnr_number)
+        count("cases_skipped")
+        return True
+    return False
 
-                # ------------------ COLLECT ALL CASE LINKS ------------------
-                # Instead of just first "View" link, get them all
-                total_cases = driver.find_element(
-                    By.XPATH, "//div[@id='showList2']/div[2]/a"
-                )
-                total_cases = total_cases.text.strip().split(":")[-1].strip()
-                print(f"Found {total_cases} cases on this page.")
 
-                # Loop over each result
-                for i in range(int(total_cases)):
-                    # Because going back can stale the references, re-find them each iteration
-                    view_buttons = driver.find_elements(By.XPATH, "//a[text()='View']")
+def open_case(driver, onclick):
+    """
+    Runs a result row's View handler directly. It works from the results
+    page and from the previously opened case alike, so there is no back
+    navigation and no re-scan of the result list between cases.
+    """
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
 
-                    # Click the i-th "View" link
-                    driver.execute_script(
-                        "arguments[0].scrollIntoView(true);", view_buttons[i]
-                    )
-                    time.sleep(1)
-                    driver.execute_script("arguments[0].click();", view_buttons[i])
-                    time.sleep(2)
+    previous = driver.find_elements(By.CSS_SELECTOR, "table.case_details_table")
 
-                    # Extract details & download PDFs
-                    case_data = extract_case_details(driver)
+    def _open():
+        driver.execute_script(onclick)
+        if previous:
+            # Wait for the previous case to be replaced
+            wait_for(driver, "case_details", EC.staleness_of(previous[0]))
 
-                    case_data["state"] = state
-                    case_data["district"] = district
-                    case_data["court_complex"] = court_complex
+    with timed("navigation"):
+        # The handler can simply run again if the portal did not answer
+        get_governor().call(_open, retry_on=(TimeoutException,))
 
-                    save_to_mongodb(case_data)
 
-                    # Go back to results page
-                    driver.back()
-                    time.sleep(3)  # Let it load before next iteration
+def run_search(session, job, settings):
+    """
+    Performs the search of `job` in the worker's browser session and scrapes
+    the cases of the result list that belong to its shard. Returns the
+    number of cases stored.
+    """
+    import network_capture
+
+    with timed("navigation"):
+        session.open_search_form(job.state, job.district, job.court_complex)
+        session.fill_search_form(job.case_type, job.status, job.year)
+    driver = session.driver
+
+    # Solve Captcha and submit
+    total_cases = submit_search_with_captcha(driver)
+    if total_cases == NO_RECORDS:
+        print(f"[{describe(job)}] Found 0 cases.")
+        dismiss_validate_error(driver)
+        return 0
+    total_cases = total_cases.text.strip().split(":")[-1].strip()
+    print(f"[{describe(job)}] Found {total_cases} cases.")
+
+    # ------------------ COLLECT ALL CASE LINKS ------------------
+    # Parse the result list once; every case is opened straight from it
+    html = driver.page_source
+    if ARCHIVE is not None:
+        ARCHIVE.save_results(unit_key(job), html)
+    # With --record: the search form, captcha and results loaded so far
+    network_capture.flush_recording(driver)
+    results = parse_results_page(html)
+    results = [r for r in results if r["index"] % job.shards == job.shard]
+
+    key = unit_key(job, CRAWL)
+    stored = 0
+
+    # Loop over each result
+    for done, result in enumerate(results, 1):
+        i = result["index"]
+        if skip_result(key, i, result["cnr_number"], settings):
+            print(f"Skipped: {done}/{len(results)}", end="\r")
+            continue
+
+        open_case(driver, result["onclick"])
+
+        # Extract details & download PDFs
+        if settings.snapshot:
+            case_data = extract_case_details_snapshot(driver)
+        else:
+            case_data = extract_case_details(driver)
+        network_capture.flush_recording(driver)
+
+        case_data["state"] = job.state
+        case_data["district"] = job.district
+        case_data["court_complex"] = job.court_complex
+
+        save_case(case_data, partial(CHECKPOINTS.finish_unit, key, i, case_data))
+        stored += 1
+
+        print(f"Done: {done}/{len(results)}", end="\r")
+
+    print(f"\n[{describe(job)}] All cases processed. Stored in DB.")
+    return stored
+
+
+# ----------------------- HTTP MODE -----------------------
+def submit_with_captcha(http, submit):
+    """
+    Fetches and solves a captcha over HTTP and calls submit(captcha_text),
+    with a fresh captcha for every rejected attempt.
+    """
+    from captcha_solver import MAX_ATTEMPTS as MAX_CAPTCHA_ATTEMPTS
+    from captcha_solver import solve as solve_captcha
+
+    for attempt in range(1, MAX_CAPTCHA_ATTEMPTS + 1):
+        with timed("captcha"):
+            captcha_text = solve_captcha(http.captcha_image())
+        count("captcha_attempts")
+        try:
+            with timed("search_submit"):
+                return submit(captcha_text)
+        except CaptchaError:
+            count("captcha_rejected")
+            logger.info(f"Captcha {captcha_text!r} rejected (attempt {attempt})")
+            if attempt == MAX_CAPTCHA_ATTEMPTS:
+                raise
 
-                    print(f"Done: {i + 1}/{len(view_buttons)}", end="\r")
 
-                print("\nAll cases processed. Stored in DB.")
+def extract_case_details_http(http, onclick):
+    """
+    Same result as extract_case_details, built from the portal's XHR
+    responses instead of a browser.
+    """
+    if PDF_PIPELINE is not None:
+        PDF_PIPELINE.begin_case()
+    with timed("case_details"):
+        html = http.view_case(onclick)
+        case_data = parse_case_details(html)
+        links = parse_case_links(html)
+    if ARCHIVE is not None:
+        ARCHIVE.stage_case(html)
 
-            except Exception as e:
-                print(f"An error occurred: {str(e)}")
+    try:
+        fill_business_on_date(http, case_data["history"], links["business"])
+    except Exception as e:
+        logger.error(f"Exception: {e}")
+        blank_business_on_date(case_data["history"])
 
-            finally:
-                # Cleanup
-                if os.path.exists("temp.png"):
-                    os.remove("temp.png")
-                time.sleep(2)
-                driver.quit()
+    for order_info, link in zip(case_data["orders"], links["orders"]):
+        if not link:
+            continue
+        try:
+            if PDF_PIPELINE is not None:
+                url = http.order_pdf_url(link)
+                if url:
+                    PDF_PIPELINE.stage(order_info, url, http.session.cookies.get_dict())
+                continue
+            with timed("order_pdf"):
+                data = http.order_pdf(link)
+            order_info["url"] = (
+                store_pdf_bytes(data, case_data["details"]) if data else ""
+            )
+        except Exception as ex:
+            logger.error(
+                f"Error downloading PDF for order {order_info['date']}: {str(ex)}"
+            )
+
+    return case_data
+
+
+def run_http_search(job, settings):
+    """
+    run_search without a browser: the search form, captcha and case pages
+    are all fetched with EcourtsClient.
+    """
+    http = EcourtsClient(base_url=settings.base_url, record_dir=settings.record)
+
+    with timed("navigation"):
+        state_code = http.bootstrap()[job.state]
+        dist_code = http.districts(state_code)[job.district]
+        complex_value = http.court_complexes(state_code, dist_code)[job.court_complex]
+        http.set_location(state_code, dist_code, complex_value)
+        case_type = http.case_types()[job.case_type]
+
+    results_html = submit_with_captcha(
+        http,
+        lambda captcha: http.search_case_type(case_type, job.year, job.status, captcha),
+    )
+
+    if ARCHIVE is not None:
+        ARCHIVE.save_results(unit_key(job), results_html)
+    results = parse_results_page(results_html)
+    print(f"[{describe(job)}] Found {len(results)} cases.")
+    results = [r for r in results if r["index"] % job.shards == job.shard]
+
+    key = unit_key(job, CRAWL)
+    stored = 0
+
+    for done, result in enumerate(results, 1):
+        i = result["index"]
+        if skip_result(key, i, result["cnr_number"], settings):
+            print(f"Skipped: {done}/{len(results)}", end="\r")
+            continue
+
+        case_data = extract_case_details_http(http, result["onclick"])
+
+        case_data["state"] = job.state
+        case_data["district"] = job.district
+        case_data["court_complex"] = job.court_complex
+
+        save_case(case_data, partial(CHECKPOINTS.finish_unit, key, i, case_data))
+        stored += 1
+
+        print(f"Done: {done}/{len(results)}", end="\r")
+
+    print(f"\n[{describe(job)}] All cases processed. Stored in DB.")
+    return stored
+
+
+def run_job(job, settings, crawl=None):
+    """
+    Runs a single search job in the process' browser session (or an HTTP
+    session with --http). `crawl` is the queue's crawl of the job (--queue).
+    Returns (cases stored, wait timings, metrics, finished) of this job.
+    """
+    global CHECKPOINTS, PDF_PIPELINE, BUSINESS_WORKERS, ARCHIVE, CAPTURE_PDFS
+    global SINK_SPEC, CRAWL, PORTAL_BASE_URL, RECORD_DIR
+
+    label = describe(job)
+    WAIT_STATS.clear()
+    set_labels(court_complex=job.court_complex)
+    finished = False
+    cases = 0
+    failed_batches = SINK.failed if SINK is not None else 0
+    BUSINESS_WORKERS = 0 if settings.skip_business else settings.business_workers
+    CAPTURE_PDFS = settings.capture_pdfs and not settings.http
+    SINK_SPEC = settings.sink
+    CRAWL = crawl
+    PORTAL_BASE_URL = settings.base_url
+    RECORD_DIR = settings.record
+    CHECKPOINTS = CheckpointStore(settings.checkpoint)
+    if crawl is not None:
+        CHECKPOINTS.forget_crawls(unit_key(job, crawl))
+    ARCHIVE = PageArchive(settings.archive) if settings.archive else None
+    if settings.async_pdfs:
+        PDF_PIPELINE = PdfPipeline(
+            upload_pdf_stream_to_azure,
+            patch_order_url,
+            workers=settings.pdf_workers,
+            queue_size=settings.pdf_queue,
+            record=record_response,
+        )
+    try:
+        if settings.http:
+            cases = run_http_search(job, settings)
+        else:
+            from selenium.common.exceptions import WebDriverException
+
+            session = get_browser_session(settings)
+            try:
+                cases = run_search(session, job, settings)
+            except WebDriverException:
+                if session.alive():
+                    raise
+                # The browser died: run the job again in a fresh one, the
+                # checkpoints skip every case that was already stored
+                cases = run_search(session, job, settings)
+        finished = True
+    except Exception as e:
+        print(f"An error occurred in [{label}]: {str(e)}")
+        logger.error(f"Job {job} failed: {e}")
+        cases = 0
+    finally:
+        if PDF_PIPELINE is not None:
+            PDF_PIPELINE.close()
+            print(
+                f"[{label}] Order PDFs uploaded: "
+                f"{PDF_PIPELINE.completed}, failed: {PDF_PIPELINE.failed}"
+            )
+            PDF_PIPELINE = None
+        # Everything of this job (including PDF url patches) hits the database
+        if SINK is not None:
+            SINK.flush()
+            print(f"[{label}] {SINK.report()}")
+        print(f"[{label}] {get_governor().report()}")
+        # A case or patch that did not make it into a batch (or is still
+        # waiting for a retry) leaves the job unfinished, so it runs again
+        if finished and (
+            CHECKPOINTS.units_finished < cases
+            or SINK is not None
+            and (SINK.pending() or SINK.failed > failed_batches)
+        ):
+            print(f"[{label}] Not every case was stored, the job will run again.")
+            logger.error(
+                f"Job {job}: {CHECKPOINTS.units_finished} of {cases} cases stored"
+            )
+            finished = False
+        # Only now is every case of the job stored
+        if finished:
+            CHECKPOINTS.finish_job(job_key(job), cases)
+        CHECKPOINTS.close()
+        CHECKPOINTS = None
+        ARCHIVE = None
+
+    return cases, dict(WAIT_STATS), metrics.drain(), finished
+
+
+def store_reparsed(batch):
+    """
+    Saves re-parsed cases, keeping the order PDF urls and texts of the stored
+    documents (the archive has no PDFs).
+    """
+    cnr_numbers = [case_data["details"]["cnr_number"] for case_data in batch]
+    stored_orders = {
+        doc["details"]["cnr_number"]: doc.get("orders", [])
+        for doc in get_collection().find(
+            {"details.cnr_number": {"$in": cnr_numbers}},
+            {"details.cnr_number": 1, "orders": 1},
+        )
+    }
+    for case_data in batch:
+        stored = {
+            order_key(order): order
+            for order in stored_orders.get(case_data["details"]["cnr_number"], [])
+        }
+        for order in case_data["orders"]:
+            previous = stored.get(order_key(order), {})
+            order["url"] = previous.get("url", "")
+            if "text" in previous:
+                order["text"] = previous["text"]
+        save_to_mongodb(case_data)
+
+
+def reparse_archive(settings):
+    """
+    --reparse: rebuilds every case of the --archive directory offline and
+    stores it. Returns the number of cases.
+    """
+    total = 0
+    batch = []
+    for case_data in reparse(settings.archive, workers=settings.reparse_workers):
+        batch.append(case_data)
+        if len(batch) >= MONGO_BATCH_SIZE:
+            store_reparsed(batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        store_reparsed(batch)
+        total += len(batch)
+    get_sink().flush()
+    return total
+
+
+def pending_order_texts():
+    """
+    {blob name: [(cnr number, order index), ...]} of the stored order PDFs
+    without text.
+    """
+    pending = defaultdict(list)
+    cursor = get_collection().find(
+        {"orders": {"$elemMatch": {"url": {"$nin": ["", None]}, "text": None}}},
+        {"details.cnr_number": 1, "orders.url": 1, "orders.text": 1},
+    )
+    for doc in cursor:
+        for index, order in enumerate(doc.get("orders", [])):
+            if order.get("url") and order.get("text") is None:
+                pending[blob_name_from_url(order["url"])].append(
+                    (doc["details"]["cnr_number"], index)
+                )
+    return pending
+
+
+def extract_order_texts(settings):
+    """
+    --extract-text: stores the text of every order PDF next to its order
+    (orders[i].text), reading each distinct PDF at most once. Returns the
+    number of orders updated.
+    """
+    cache = get_db()[TEXT_COLLECTION]
+    pending = pending_order_texts()
+
+    texts = {
+        doc["_id"]: doc["text"]
+        for doc in cache.find({"_id": {"$in": list(pending)}}, {"text": 1})
+    }
+    count("order_texts_cached", len(texts))
+    missing = [name for name in pending if name not in texts]
+    if settings.text_limit:
+        missing = missing[: settings.text_limit]
+    print(
+        f"{len(pending)} order PDFs without text, {len(texts)} cached, "
+        f"extracting {len(missing)}."
+    )
+
+    with text_pool(settings.text_workers) as executor:
+        # One PDF per task: OCR time varies wildly between PDFs
+        for done, (name, result) in enumerate(
+            zip(missing, executor.map(blob_text, missing)), 1
+        ):
+            if result is not None:
+                cache.replace_one(
+                    {"_id": name},
+                    dict(result, extracted_at=datetime.now()),
+                    upsert=True,
+                )
+                texts[name] = result["text"]
+                count("order_texts_extracted")
+                count("order_text_ocr_pages", result["ocr_pages"])
+            print(f"Extracted: {done}/{len(missing)}", end="\r")
+
+    updated = 0
+    for name, orders in pending.items():
+        if name not in texts:
+            continue
+        for cnr_number, index in orders:
+            get_sink().patch(cnr_number, {f"orders.{index}.text": texts[name]})
+            updated += 1
+    get_sink().flush()
+    return updated
+
+
+def run_queue_worker(settings):
+    """
+    Claims jobs from the shared Mongo queue and runs them until none is left.
+    Returns the run_job() results.
+    """
+    queue = JobQueue(get_db()[QUEUE_COLLECTION], lease_seconds=settings.lease)
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    results = []
+    while True:
+        claimed = queue.claim(owner)
+        if claimed is None:
+            return results
+        key, job, crawl = claimed
+        with queue.heartbeat(key, owner):
+            result = run_job(job, settings, crawl)
+        cases, _, _, finished = result
+        if finished:
+            queue.complete(key, owner, cases)
+        else:
+            queue.release(key, owner, error="job failed, see scraper.log")
+        results.append(result)
+
+
+def main():
+    global SINK_SPEC
+
+    from sinks import parse_sink
+
+    parser = argparse.ArgumentParser(description="eCourts district court scraper")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of parallel headless browser sessions (default: 1)",
+    )
+    parser.add_argument(
+        "--headless",
+        action="store_true",
+        help="Run Chrome headless (always on when --workers > 1)",
+    )
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="Parse each case details page from a single page_source snapshot",
+    )
+    parser.add_argument(
+        "--http",
+        action="store_true",
+        help="Skip the browser and replay the portal's XHR calls with requests",
+    )
+    parser.add_argument(
+        "--base-url",
+        default=BASE_URL,
+        help="eCourts base url (point at replay_server.py for tests and benchmarks)",
+    )
+    parser.add_argument(
+        "--record",
+        metavar="DIR",
+        help="Store every portal response in DIR for replay_server.py (in the "
+        "browser: everything the browser loads)",
+    )
+    parser.add_argument(
+        "--async-pdfs",
+        action="store_true",
+        help="Download and upload order PDFs on background threads",
+    )
+    parser.add_argument(
+        "--pdf-workers",
+        type=int,
+        default=4,
+        help="Background PDF transfer threads per job (default: 4)",
+    )
+    parser.add_argument(
+        "--pdf-queue",
+        type=int,
+        default=32,
+        help="Pending PDFs before the scraper waits for the uploaders (default: 32)",
+    )
+    parser.add_argument(
+        "--capture-pdfs",
+        action="store_true",
+        help="Take order PDFs from the browser's own network traffic instead of "
+        "downloading them again, and block images, fonts and CSS (except the "
+        "captcha)",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        default=CHECKPOINT_FILE,
+        metavar="PATH",
+        help="SQLite file used to resume interrupted crawls (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Ignore checkpoints and re-scrape cases that are already stored",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Only re-fetch stored pending cases whose hearing date has passed",
+    )
+    parser.add_argument(
+        "--refresh-ttl",
+        type=float,
+        default=7,
+        metavar="DAYS",
+        help="With --refresh, also re-fetch cases not scraped for DAYS (default: 7)",
+    )
+    parser.add_argument(
+        "--business-workers",
+        type=int,
+        default=BUSINESS_WORKERS,
+        help="Business on date requests fetched at once per case "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--skip-business",
+        action="store_true",
+        help="Don't fetch business on date entries (fast first-pass crawls)",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=1,
+        help="Split every search into this many jobs over its result rows, so "
+        "workers share a large result list (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--refresh-limit",
+        type=int,
+        default=0,
+        help="With --refresh, refresh at most this many cases (default: all)",
+    )
+    parser.add_argument(
+        "--archive",
+        metavar="DIR",
+        help="Keep the raw case, business on date and results pages in DIR "
+        "(gzip compressed, by CNR and fetch time)",
+    )
+    parser.add_argument(
+        "--reparse",
+        action="store_true",
+        help="Rebuild every case of --archive DIR offline and store it",
+    )
+    parser.add_argument(
+        "--reparse-workers",
+        type=int,
+        help="Processes for --reparse (default: one per CPU)",
+    )
+    parser.add_argument(
+        "--extract-text",
+        action="store_true",
+        help="Store the text of every order PDF that has none yet (text layer, "
+        "else Tesseract OCR), then exit",
+    )
+    parser.add_argument(
+        "--text-workers",
+        type=int,
+        help="Processes for --extract-text (default: one per CPU)",
+    )
+    parser.add_argument(
+        "--text-limit",
+        type=int,
+        default=0,
+        help="With --extract-text, read at most this many PDFs (default: all)",
+    )
+    parser.add_argument(
+        "--sink",
+        type=parse_sink,
+        metavar="KIND:DIR",
+        help="Write cases to rolling local files instead of Mongo: jsonl:DIR "
+        "(gzip JSON lines) or parquet:DIR; load them later with --load DIR",
+    )
+    parser.add_argument(
+        "--load",
+        metavar="DIR",
+        help="Push the files of a --sink DIR into Mongo, then exit",
+    )
+    parser.add_argument(
+        "--load-batch",
+        type=int,
+        default=10000,
+        help="Operations per unordered bulk write of --load (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--config",
+        metavar="PATH",
+        help="JSON crawl config of courts, case types, years and statuses "
+        "(see scheduler.py; default: the built-in court complex)",
+    )
+    parser.add_argument(
+        "--years",
+        nargs="+",
+        metavar="YEAR",
+        help="Crawl these years instead of the ones in the config",
+    )
+    parser.add_argument(
+        "--queue",
+        action="store_true",
+        help="Take jobs from the shared Mongo job queue, so several processes "
+        "and machines can work on one crawl",
+    )
+    parser.add_argument(
+        "--lease",
+        type=float,
+        default=600,
+        metavar="SECONDS",
+        help="With --queue, seconds until an unrenewed job is handed to another "
+        "worker (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=5.0,
+        help="Most portal requests per second and process; lowered automatically "
+        "while the portal throttles (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=8,
+        help="Most portal requests in flight per process (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        default=4,
+        help="Retries of a throttled or failed portal request (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        default=os.path.join(LOG_DIR, "metrics.json"),
+        metavar="PATH",
+        help="Where stage timings and counters are dumped as JSON "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        default=30,
+        metavar="SECONDS",
+        help="Seconds between JSON metric dumps (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        metavar="PORT",
+        help="Serve Prometheus metrics on PORT at /metrics",
+    )
+    args = parser.parse_args()
+    SINK_SPEC = args.sink
+    # With --force, rows checkpointed before this run are scraped again
+    args.started_at = time.time()
+
+    governor_settings = {
+        "rate": args.rate,
+        "max_concurrency": args.max_concurrency,
+        "max_retries": args.max_retries,
+    }
+    configure_governor(**governor_settings)
+
+    metrics.start_json_dump(args.metrics_file, args.metrics_interval)
+    if args.metrics_port:
+        metrics.start_http_server(args.metrics_port)
+
+    if args.load:
+        from sinks import load
+
+        written = load(args.load, get_collection(), batch_size=args.load_batch)
+        print(f"\nLoaded {written} writes from {args.load}.")
+        metrics.write_json(args.metrics_file)
+        return
+
+    if args.reparse:
+        if not args.archive:
+            parser.error("--reparse needs --archive DIR")
+        with timed("reparse"):
+            cases = reparse_archive(args)
+        print(f"Re-parsed {cases} cases. {get_sink().report()}")
+        SINK.close()
+        metrics.write_json(args.metrics_file)
+        return
+
+    if args.extract_text:
+        with timed("extract_text"):
+            updated = extract_order_texts(args)
+        print(f"\nStored the text of {updated} orders. {get_sink().report()}")
+        SINK.close()
+        metrics.write_json(args.metrics_file)
+        return
+
+    if args.refresh:
+        from mongo_writer import ensure_indexes
+
+        ensure_indexes(get_collection())
+        http = EcourtsClient(base_url=args.base_url, record_dir=args.record)
+        refreshed = refresh_cases(
+            get_collection(),
+            http,
+            submit_with_captcha,
+            store_pdf_bytes,
+            ttl_days=args.refresh_ttl,
+            limit=args.refresh_limit,
+        )
+        print(f"Refreshed {refreshed} cases.")
+        metrics.write_json(args.metrics_file)
+        return
+
+    jobs = build_jobs(args)
+
+    if args.queue:
+        # The queue is shared with every other node crawling the same config
+        queue = JobQueue(get_db()[QUEUE_COLLECTION], lease_seconds=args.lease)
+        open_jobs = queue.enqueue(jobs, job_key, restart=args.force)
+        print(f"{open_jobs} of {len(jobs)} jobs open in the shared queue.")
+    else:
+        # Resume an interrupted crawl at its first unfinished job
+        checkpoints = CheckpointStore(args.checkpoint)
+        remaining = checkpoints.start_crawl(
+            [job_key(job) for job in jobs], force=args.force
+        )
+        checkpoints.close()
+        if len(remaining) < len(jobs):
+            print(
+                f"Resuming crawl: {len(jobs) - len(remaining)} jobs already finished."
+            )
+        jobs = [job for job in jobs if job_key(job) in remaining]
+
+    results = []
+
+    def collect(batch):
+        for result in batch:
+            results.append(result)
+            # Keeps the periodic dumps current while the pool runs
+            metrics.merge(result[2])
+
+    if args.workers <= 1:
+        if args.queue:
+            collect(run_queue_worker(args))
+        else:
+            for job in jobs:
+                collect([run_job(job, args)])
+    else:
+        args.headless = True
+        with ProcessPoolExecutor(
+            max_workers=args.workers,
+            initializer=init_worker,
+            initargs=(governor_settings,),
+        ) as executor:
+            if args.queue:
+                futures = [
+                    executor.submit(run_queue_worker, args) for _ in range(args.workers)
+                ]
+            else:
+                futures = [executor.submit(run_job, job, args) for job in jobs]
+            for future in as_completed(futures):
+                result = future.result()
+                collect(result if args.queue else [result])
+
+    total = 0
+    WAIT_STATS.clear()
+    for cases, stats, _, _ in results:
+        total += cases
+        merge_wait_stats(stats)
+
+    print(f"Finished {len(results)} jobs, {total} cases stored.")
+
+    # Real time spent waiting on the portal, per step
+    print_wait_report()
+
+    if SINK is not None:
+        SINK.close()
+
+    # Where the time of the run went, per stage
+    metrics.print_stage_report()
+    metrics.write_json(args.metrics_file)
+
+    if BROWSER_SESSION is not None:
+        BROWSER_SESSION.quit()
+
+
+if __name__ == "__main__":
+    main()
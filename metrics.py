@@ -0,0 +1,292 @@
+"""
+Run metrics: per-stage timings and counters.
+
+Every stage of a scrape (navigation, captcha, search submit, case details,
+history, order PDF download, blob upload, Mongo write) is timed into a
+histogram labelled with the stage and the court complex, next to a few
+counters. Pool workers hand their samples to the parent with drain(), which
+merge()s them.
+
+The parent dumps everything as JSON every few seconds (start_json_dump) and
+can serve it in the Prometheus text format (start_http_server):
+
+    python main.py --metrics-port 9108
+    curl localhost:9108/metrics
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("scraper")
+
+PREFIX = "scraper"
+
+# Upper bounds (seconds) of the stage histogram buckets
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Labels added to every sample, e.g. {"court_complex": ...}
+LABELS = {}
+
+# Keep every raw timing next to the buckets (see keep_samples())
+KEEP_SAMPLES = False
+
+_counters = {}  # (name, labels) -> value
+_histograms = {}  # (stage, labels) -> {"buckets", "sum", "count"}
+_lock = threading.Lock()
+
+
+def set_labels(**labels):
+    with _lock:
+        LABELS.clear()
+        LABELS.update(labels)
+
+
+def _labels(labels):
+    return tuple(sorted(dict(LABELS, **labels).items()))
+
+
+def keep_samples(enabled=True):
+    """
+    Also keeps the raw seconds of every timing ("samples" of a histogram), for
+    exact percentiles in benchmarks. Long crawls should leave this off.
+    """
+    global KEEP_SAMPLES
+
+    KEEP_SAMPLES = enabled
+
+
+# Recording ######################################################
+def count(name, value=1, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(stage, seconds, **labels):
+    key = (stage, _labels(labels))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {
+                "buckets": [0] * len(BUCKETS),
+                "sum": 0.0,
+                "count": 0,
+            }
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram["buckets"][i] += 1
+        histogram["sum"] += seconds
+        histogram["count"] += 1
+        if KEEP_SAMPLES:
+            histogram.setdefault("samples", []).append(seconds)
+
+
+@contextmanager
+def timed(stage, **labels):
+    """
+    Times the block into the stage histogram. Failing blocks are also
+    counted as stage errors.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        count("stage_errors", stage=stage, **labels)
+        raise
+    finally:
+        observe(stage, time.perf_counter() - start, **labels)
+
+
+# Moving samples between processes ###############################
+def _copy(histogram):
+    copy = dict(histogram, buckets=list(histogram["buckets"]))
+    if "samples" in histogram:
+        copy["samples"] = list(histogram["samples"])
+    return copy
+
+
+def snapshot():
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "histograms": {
+                key: _copy(histogram) for key, histogram in _histograms.items()
+            },
+        }
+
+
+def drain():
+    """
+    Returns everything recorded so far and starts over.
+    """
+    with _lock:
+        samples = {"counters": dict(_counters), "histograms": dict(_histograms)}
+        _counters.clear()
+        _histograms.clear()
+    return samples
+
+
+def merge(samples):
+    """
+    Adds samples drain()ed in another process (or job).
+    """
+    with _lock:
+        for key, value in samples["counters"].items():
+            _counters[key] = _counters.get(key, 0) + value
+        for key, other in samples["histograms"].items():
+            histogram = _histograms.get(key)
+            if histogram is None:
+                _histograms[key] = _copy(other)
+                continue
+            for i, value in enumerate(other["buckets"]):
+                histogram["buckets"][i] += value
+            histogram["sum"] += other["sum"]
+            histogram["count"] += other["count"]
+            if "samples" in other:
+                histogram.setdefault("samples", []).extend(other["samples"])
+
+
+# Export #########################################################
+def to_json():
+    samples = snapshot()
+    return {
+        "generated_at": time.time(),
+        "counters": [
+            {"name": name, "labels": dict(labels), "value": value}
+            for (name, labels), value in sorted(samples["counters"].items())
+        ],
+        "stages": [
+            {
+                "stage": stage,
+                "labels": dict(labels),
+                "count": histogram["count"],
+                "sum": histogram["sum"],
+                "mean": histogram["sum"] / histogram["count"],
+                "buckets": dict(zip(map(str, BUCKETS), histogram["buckets"])),
+            }
+            for (stage, labels), histogram in sorted(samples["histograms"].items())
+        ],
+    }
+
+
+def write_json(path):
+    """
+    Writes to_json() to `path`, replacing the previous dump atomically.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(to_json(), f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def start_json_dump(path, interval=30):
+    """
+    Rewrites the JSON dump every `interval` seconds on a daemon thread.
+    """
+
+    def _dump():
+        while True:
+            time.sleep(interval)
+            try:
+                write_json(path)
+            except Exception as e:
+                logger.error(f"Could not write metrics to {path}: {e}")
+
+    threading.Thread(target=_dump, name="metrics-dump", daemon=True).start()
+
+
+def _format_labels(labels, **extra):
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ""
+    escaped = (
+        (
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in items
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def prometheus_text():
+    """
+    Everything in the Prometheus text exposition format.
+    """
+    samples = snapshot()
+    lines = []
+
+    by_name = {}
+    for (name, labels), value in sorted(samples["counters"].items()):
+        by_name.setdefault(name, []).append((labels, value))
+    for name, rows in by_name.items():
+        lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+        for labels, value in rows:
+            lines.append(f"{PREFIX}_{name}_total{_format_labels(labels)} {value}")
+
+    name = f"{PREFIX}_stage_seconds"
+    lines.append(f"# TYPE {name} histogram")
+    for (stage, labels), histogram in sorted(samples["histograms"].items()):
+        labels = labels + (("stage", stage),)
+        for bound, value in zip(BUCKETS, histogram["buckets"]):
+            lines.append(f"{name}_bucket{_format_labels(labels, le=bound)} {value}")
+        lines.append(
+            f"{name}_bucket{_format_labels(labels, le='+Inf')} {histogram['count']}"
+        )
+        lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']}")
+        lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            body = prometheus_text().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path == "/metrics.json":
+            body = json.dumps(to_json()).encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, host="0.0.0.0"):
+    """
+    Serves /metrics (Prometheus) and /metrics.json on a daemon thread.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(
+        target=server.serve_forever, name="metrics-http", daemon=True
+    ).start()
+    return server
+
+
+def print_stage_report():
+    """
+    Time per stage over every court complex.
+    """
+    totals = {}
+    for row in to_json()["stages"]:
+        total = totals.setdefault(row["stage"], [0, 0.0])
+        total[0] += row["count"]
+        total[1] += row["sum"]
+    if not totals:
+        return
+    print(f"{'stage':<18}{'count':>7}{'mean':>9}{'total':>10}")
+    for stage, (samples, seconds) in sorted(totals.items(), key=lambda i: -i[1][1]):
+        print(f"{stage:<18}{samples:>7}{seconds / samples:>9.2f}{seconds:>10.2f}")
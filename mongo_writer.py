@@ -0,0 +1,249 @@
+"""
+Buffered, idempotent MongoDB writer.
+
+Cases are upserted on details.cnr_number, so re-running a crawl updates the
+stored documents instead of duplicating them. Writes are buffered and sent as
+one unordered bulk_write once `batch_size` documents are pending or
+`flush_interval` seconds have passed. A batch that fails as a whole (e.g. the
+connection dropped) stays buffered and is sent again, later after every
+failure. sinks.py writes the same batches to local files instead.
+"""
+
+import logging
+import threading
+import time
+
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure, PyMongoError
+
+from metrics import count, observe
+
+logger = logging.getLogger("scraper")
+
+CNR_FIELD = "details.cnr_number"
+
+# Longest wait before a failed batch is sent again, and the attempts close()
+# makes before giving up on it
+MAX_RETRY_DELAY = 60.0
+CLOSE_ATTEMPTS = 5
+
+
+def ensure_indexes(collection):
+    """
+    Unique index on the CNR number. Collections that already hold duplicates
+    from older runs get a plain index instead, with a warning. The refresh
+    mode selects cases by next hearing and scrape time.
+    """
+    collection.create_index("next_hearing_at", name="next_hearing_at")
+    collection.create_index("scraped_at", name="scraped_at")
+
+    try:
+        collection.create_index(
+            CNR_FIELD,
+            unique=True,
+            partialFilterExpression={CNR_FIELD: {"$type": "string"}},
+            name="cnr_number_unique",
+        )
+    except OperationFailure as e:
+        logger.warning(f"Could not create unique CNR index, using a plain one: {e}")
+        collection.create_index(CNR_FIELD, name="cnr_number")
+
+
+def set_path(doc, path, value):
+    """
+    Applies a {"$set": {"a.1.b": value}} style update to an in-memory document.
+    """
+    keys = path.split(".")
+    target = doc
+    for key in keys[:-1]:
+        target = target[int(key)] if isinstance(target, list) else target[key]
+    if isinstance(target, list):
+        target[int(keys[-1])] = value
+    else:
+        target[keys[-1]] = value
+
+
+class BulkWriter:
+    def __init__(self, collection, batch_size=100, flush_interval=5.0):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.docs = {}  # cnr_number -> document
+        self.patches = []  # (cnr_number, {path: value})
+        self.callbacks = []  # run once the pending documents are stored
+
+        self.written = 0
+        self.batches = 0
+        self.seconds = 0.0
+        self.errors = 0
+        self.failed = 0  # batches whose callbacks were dropped
+        self.retries = 0  # batches kept for another attempt
+
+        self._lock = threading.RLock()
+        self._last_flush = time.monotonic()
+        self._failures = 0  # consecutive failed attempts
+        self._retry_at = 0.0
+        self._stop = threading.Event()
+
+        if collection is not None:
+            ensure_indexes(collection)
+
+        self._timer = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._timer.start()
+
+    def write(self, doc, on_stored=None):
+        """
+        Buffers a case. `on_stored()` is called after the batch holding it was
+        written successfully. A case without CNR number (e.g. from a page that
+        failed to load) is not stored and False is returned.
+        """
+        cnr_number = doc.get("details", {}).get("cnr_number")
+        if not cnr_number:
+            logger.error("Not storing a case without CNR number")
+            count("cases_without_cnr")
+            return False
+        with self._lock:
+            if on_stored is not None:
+                self.callbacks.append(on_stored)
+            self.docs[cnr_number] = doc
+            # The new document replaces whatever these patches targeted
+            self.patches = [p for p in self.patches if p[0] != cnr_number]
+            self._flush_if_full()
+        return True
+
+    def patch(self, cnr_number, fields):
+        """
+        Sets `fields` on the stored case. Applied in memory while the case is
+        still buffered, otherwise sent with the next batch.
+        """
+        with self._lock:
+            doc = self.docs.get(cnr_number)
+            if doc is not None:
+                for path, value in fields.items():
+                    set_path(doc, path, value)
+            else:
+                self.patches.append((cnr_number, fields))
+                self._flush_if_full()
+
+    def pending(self):
+        return len(self.docs) + len(self.patches)
+
+    def _flush_if_full(self):
+        # After a failure the buffer waits for the retry delay to pass
+        if self.pending() >= self.batch_size and time.monotonic() >= self._retry_at:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered batch. Returns False if it was not stored: it is
+        kept for the next flush when the write failed as a whole, and its
+        callbacks are dropped when some of its operations were rejected.
+        """
+        with self._lock:
+            docs, patches, callbacks = self.docs, self.patches, self.callbacks
+            self.docs, self.patches, self.callbacks = {}, [], []
+            self._last_flush = time.monotonic()
+
+            if not (docs or patches):
+                return True
+
+            start = time.perf_counter()
+            try:
+                stored = self.write_batch(docs, patches)
+            except PyMongoError as e:
+                # Nothing is known to be written (e.g. AutoReconnect), so
+                # the whole batch is sent again; upserts and patches are
+                # idempotent
+                self.docs, self.patches = docs, patches
+                self.callbacks = callbacks
+                self.errors += 1
+                self.retries += 1
+                self._failures += 1
+                delay = min(MAX_RETRY_DELAY, self.flush_interval * 2**self._failures)
+                self._retry_at = time.monotonic() + delay
+                logger.error(
+                    f"Mongo batch of {self.pending()} writes failed, "
+                    f"retrying in {delay:.0f}s: {e}"
+                )
+                count("mongo_retries")
+                return False
+            finally:
+                self.seconds += time.perf_counter() - start
+
+            self._failures = 0
+            self._retry_at = 0.0
+            self.written += len(docs) + len(patches)
+            self.batches += 1
+            if not stored:
+                # Not knowing which cases made it, none count as stored
+                self.failed += 1
+                callbacks = []
+
+            for callback in callbacks:
+                try:
+                    callback()
+                except Exception as e:
+                    logger.error(f"Error after storing a batch: {e}")
+            return stored
+
+    def write_batch(self, docs, patches):
+        """
+        Stores one batch: {cnr_number: document} and (cnr_number, fields)
+        patches. False if anything failed.
+        """
+        operations = [
+            ReplaceOne({CNR_FIELD: cnr_number}, doc, upsert=True)
+            for cnr_number, doc in docs.items()
+        ]
+        operations += [
+            UpdateOne({CNR_FIELD: cnr_number}, {"$set": fields})
+            for cnr_number, fields in patches
+        ]
+
+        stored = True
+        start = time.perf_counter()
+        try:
+            self.collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            write_errors = e.details.get("writeErrors", [])
+            self.errors += len(write_errors)
+            logger.error(f"{len(write_errors)} Mongo bulk write errors: {e}")
+            count("mongo_errors", len(write_errors))
+            stored = False
+        observe("mongo_write", time.perf_counter() - start)
+        count("mongo_writes", len(operations))
+        return stored
+
+    def close(self):
+        """
+        Stops the flush thread and writes what is left, retrying a batch that
+        fails up to CLOSE_ATTEMPTS times.
+        """
+        self._stop.set()
+        self._timer.join()
+        for attempt in range(CLOSE_ATTEMPTS):
+            if attempt:
+                time.sleep(max(0.0, self._retry_at - time.monotonic()))
+            self.flush()
+            if not self.pending():
+                return
+        logger.error(f"Giving up on {self.pending()} writes that could not be stored")
+        count("mongo_lost", self.pending())
+
+    def report(self):
+        rate = self.written / self.seconds if self.seconds else 0.0
+        return (
+            f"Mongo: {self.written} writes in {self.batches} batches, "
+            f"{self.errors} errors, {self.retries} retried, "
+            f"{self.failed} failed batches, {rate:.0f} writes/s"
+        )
+
+    def _flush_periodically(self):
+        while not self._stop.wait(min(1.0, self.flush_interval)):
+            now = time.monotonic()
+            if now - self._last_flush >= self.flush_interval and now >= self._retry_at:
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.error(f"Periodic Mongo flush failed: {e}")
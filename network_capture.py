@@ -0,0 +1,259 @@
+"""
+Order PDFs straight from the browser's network traffic.
+
+Opening an order modal makes Chrome load the PDF into the modal's <object>.
+Instead of downloading it a second time with copied cookies, --capture-pdfs
+takes the bytes Chrome already received: the response is found in the
+DevTools performance log and read back with Network.getResponseBody. When
+Chrome did not keep the body (e.g. its PDF viewer consumed the stream) the
+page fetches the url itself, which is answered from the browser cache with
+the browser's own session.
+
+The same mode blocks images, fonts and style sheets, which a headless
+scraper never looks at. The captcha is served by securimage_show.php and is
+not matched by the blocked patterns, so it still loads.
+
+With --record the same network log feeds a TrafficRecorder, which stores
+everything the browser loads (pages, scripts, style sheets, XHRs, PDFs) for
+replay_server.py, so the browser flow can be replayed offline.
+"""
+
+import base64
+import json
+import logging
+import os
+import time
+from urllib.parse import parse_qsl
+
+from selenium.common.exceptions import WebDriverException
+
+from ecourts_client import BASE_URL, endpoint_for, save_recording
+from metrics import count
+
+logger = logging.getLogger("scraper")
+
+# Network.setBlockedURLs patterns; "*" matches anything, query strings included
+BLOCKED_URLS = [
+    f"*.{extension}*"
+    for extension in (
+        "css",
+        "png",
+        "jpg",
+        "jpeg",
+        "gif",
+        "svg",
+        "ico",
+        "webp",
+        "woff",
+        "woff2",
+        "ttf",
+        "eot",
+        "otf",
+    )
+]
+
+# Response bodies Chrome keeps for Network.getResponseBody
+MAX_RESOURCE_BUFFER = 32 * 1024 * 1024
+MAX_TOTAL_BUFFER = 128 * 1024 * 1024
+
+# Reads a url in the page (cookies and cache of the browser), base64 encoded
+FETCH_JS = """
+const done = arguments[arguments.length - 1];
+fetch(arguments[0], {credentials: "include", cache: "force-cache"})
+    .then(resp => resp.ok ? resp.blob() : Promise.reject(resp.status))
+    .then(blob => {
+        const reader = new FileReader();
+        reader.onload = () => done(reader.result.split(",", 2)[1]);
+        reader.onerror = () => done(null);
+        reader.readAsDataURL(blob);
+    })
+    .catch(() => done(null));
+"""
+
+# TrafficRecorder the network events are shown to (--record)
+RECORDER = None
+
+
+def enable_logging(options):
+    """
+    Makes chromedriver record DevTools network events in the performance log.
+    Call on the Options before the driver is created.
+    """
+    options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    options.add_experimental_option("perfLoggingPrefs", {"enableNetwork": True})
+
+
+def enable(driver, block=True):
+    """
+    Keeps response bodies around for capture and blocks BLOCKED_URLS.
+    """
+    driver.execute_cdp_cmd(
+        "Network.enable",
+        {
+            "maxResourceBufferSize": MAX_RESOURCE_BUFFER,
+            "maxTotalBufferSize": MAX_TOTAL_BUFFER,
+        },
+    )
+    if block:
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URLS})
+
+
+def discard_events(driver):
+    """
+    Drops the network events recorded so far, so the next capture only looks
+    at what happens after this call.
+    """
+    network_events(driver)
+
+
+def network_events(driver):
+    """
+    [(method, params)] of the DevTools events since the last call. Reading
+    the log empties it, so every event is shown to the recorder here.
+    """
+    events = []
+    for entry in driver.get_log("performance"):
+        message = json.loads(entry["message"])["message"]
+        events.append((message.get("method"), message.get("params", {})))
+    if RECORDER is not None:
+        for method, params in events:
+            RECORDER.observe(driver, method, params)
+    return events
+
+
+def captured_body(driver, url, timeout=10):
+    """
+    The body of the response to `url` the browser received since the last
+    discard_events(), or None if it was not seen or not kept.
+    """
+    request_id = None
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        for method, params in network_events(driver):
+            if method == "Network.responseReceived":
+                if params["response"]["url"] == url:
+                    request_id = params["requestId"]
+                    if params["response"]["status"] != 200:
+                        return None
+            elif method == "Network.loadingFinished":
+                if request_id is not None and params["requestId"] == request_id:
+                    return response_body(driver, request_id)
+            elif method == "Network.loadingFailed":
+                if request_id is not None and params["requestId"] == request_id:
+                    return None
+        time.sleep(0.1)
+    return None
+
+
+def response_body(driver, request_id):
+    try:
+        body = driver.execute_cdp_cmd(
+            "Network.getResponseBody", {"requestId": request_id}
+        )
+    except WebDriverException:
+        # No resource with the given identifier (not buffered)
+        return None
+    if body.get("base64Encoded"):
+        return base64.b64decode(body["body"])
+    return body["body"].encode("latin-1")
+
+
+# Recording ######################################################
+class TrafficRecorder:
+    """
+    Stores the responses of the browser in the format of
+    EcourtsClient(record_dir=...). Portal urls are recorded by endpoint,
+    anything else by its absolute url.
+    """
+
+    def __init__(self, record_dir, base_url=BASE_URL):
+        os.makedirs(record_dir, exist_ok=True)
+        self.record_dir = record_dir
+        self.base_url = base_url
+        self.requests = {}  # request id -> (method, url, form data)
+        self.responses = {}  # request id -> (status, content type)
+        self.recorded = 0
+
+    def observe(self, driver, method, params):
+        request_id = params.get("requestId")
+        if method == "Network.requestWillBeSent":
+            request = params["request"]
+            if request["url"].startswith("http"):
+                data = dict(parse_qsl(request.get("postData", "")))
+                self.requests[request_id] = (request["method"], request["url"], data)
+        elif method == "Network.responseReceived":
+            response = params["response"]
+            headers = {k.lower(): v for k, v in response.get("headers", {}).items()}
+            content_type = headers.get("content-type", response.get("mimeType", ""))
+            self.responses[request_id] = (response["status"], content_type)
+        elif method == "Network.loadingFinished":
+            request = self.requests.pop(request_id, None)
+            response = self.responses.pop(request_id, None)
+            # Redirects are followed by the browser again on replay
+            if request is None or response is None or 300 <= response[0] < 400:
+                return
+            body = response_body(driver, request_id)
+            if body is None:
+                return
+            request_method, url, data = request
+            status, content_type = response
+            endpoint = endpoint_for(url, self.base_url)
+            save_recording(
+                self.record_dir,
+                request_method,
+                endpoint,
+                data,
+                status,
+                content_type,
+                body,
+            )
+            self.recorded += 1
+        elif method == "Network.loadingFailed":
+            self.requests.pop(request_id, None)
+            self.responses.pop(request_id, None)
+
+
+def start_recording(record_dir, base_url=BASE_URL):
+    """
+    Records the browser's traffic from now on. The driver needs the
+    performance log (enable_logging) and Network.enable (enable).
+    """
+    global RECORDER
+
+    RECORDER = TrafficRecorder(record_dir, base_url)
+
+
+def flush_recording(driver):
+    """
+    Records the responses received so far. Call before the page navigates
+    away, while the browser still holds the bodies.
+    """
+    if RECORDER is not None:
+        network_events(driver)
+
+
+def fetch_in_page(driver, url):
+    """
+    Fetches `url` from within the page. Returns the bytes, or None.
+    """
+    encoded = driver.execute_async_script(FETCH_JS, url)
+    return base64.b64decode(encoded) if encoded else None
+
+
+def pdf_bytes(driver, url):
+    """
+    The PDF at `url` as loaded by the browser, without a new HTTP session.
+    None if neither the network log nor the page could provide it.
+    """
+    data = captured_body(driver, url)
+    if data:
+        count("pdf_captured")
+        return data
+    try:
+        data = fetch_in_page(driver, url)
+    except WebDriverException as e:
+        logger.error(f"In-page fetch of {url} failed: {e}")
+        return None
+    if data:
+        count("pdf_fetched_in_page")
+    return data
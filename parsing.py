@@ -0,0 +1,359 @@
+"""
+In-process HTML parsing of eCourts pages.
+
+These functions work on a single HTML snapshot (driver.page_source or an HTTP
+response body) and never talk to the browser, so a whole case details page is
+parsed in milliseconds instead of thousands of WebDriver round trips.
+"""
+
+import re
+from datetime import datetime
+
+from bs4 import BeautifulSoup, Comment
+
+try:
+    import lxml  # noqa: F401
+
+    PARSER = "lxml"
+except ImportError:
+    PARSER = "html.parser"
+
+
+date_formate1 = lambda date: datetime.strftime(
+    datetime.strptime(date, "%d-%m-%Y"), "%d/%m/%Y"
+)
+
+
+def date_formate2(string: str):
+    pattern = r"(\d{1,2})(?:th|st|nd|rd)?\s+([A-Za-z]+)\s+(\d{4})"
+    match = re.search(pattern, string)
+    if match:
+        day = match.group(1)
+        month = match.group(2)
+        year = match.group(3)
+        month_number = datetime.strptime(month, "%B").month
+        extracted_date = datetime(
+            year=int(year), month=month_number, day=int(day)
+        ).date()
+        return extracted_date.strftime("%d/%m/%Y")
+    else:
+        return None
+
+
+def next_hearing_at(status):
+    """
+    The next hearing date of a parsed status dict as a datetime, or None.
+    """
+    formatted = date_formate2(status.get("next_hearing_date") or "")
+    if not formatted:
+        return None
+    return datetime.strptime(formatted, "%d/%m/%Y")
+
+
+def make_soup(html):
+    return BeautifulSoup(html, PARSER)
+
+
+def text_of(element):
+    """
+    Text of an element the way Selenium's `.text` renders it: <br> becomes a
+    line break and runs of whitespace collapse to a single space.
+    """
+    if element is None:
+        return ""
+    parts = []
+    for node in element.descendants:
+        if getattr(node, "name", None) == "br":
+            parts.append("\n")
+        elif isinstance(node, str) and not isinstance(node, Comment):
+            if node.parent.name not in ("script", "style"):
+                parts.append(node)
+    lines = (" ".join(line.split()) for line in "".join(parts).splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def table_text(table):
+    """
+    Selenium style text of a whole table: one line per row, cells separated
+    by spaces.
+    """
+    if table is None:
+        return ""
+    lines = []
+    for row in table.find_all("tr"):
+        cells = [text_of(cell) for cell in row.find_all(["td", "th"])]
+        line = " ".join(cell for cell in cells if cell)
+        if line:
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def parse_details(soup):
+    details = {}
+    details["case_type"] = text_of(
+        soup.select_one("td[colspan='3'].fw-bold.text-uppercase")
+    )
+
+    for row in soup.select("table.table.case_details_table tr"):
+        cells = row.find_all("td")
+        if len(cells) >= 2:
+            label = text_of(cells[0])
+            if "Filing Number" in label and len(cells) >= 4:
+                details["filing_number"] = text_of(cells[1])
+                details["filing_date"] = text_of(cells[3])
+            elif "Registration Number" in label and len(cells) >= 4:
+                details["registration_number"] = text_of(cells[1])
+                details["registration_date"] = text_of(cells[3])
+            elif "CNR Number" in label:
+                cnr = text_of(cells[1]).split()
+                details["cnr_number"] = cnr[0] if cnr else ""
+
+    if details.get("filing_date", ""):
+        details["filing_date"] = date_formate1(details["filing_date"])
+
+    if details.get("registration_number", ""):
+        details["registration_date"] = date_formate1(details["registration_date"])
+
+    return details
+
+
+STATUS_LABELS = [
+    ("First Hearing Date", "first_hearing_date"),
+    ("Decision Date", "decision_date"),
+    ("Case Status", "case_status"),
+    ("Nature of Disposal", "nature_of_disposal"),
+    ("Court Number and Judge", "court_number"),
+    ("Next Hearing Date", "next_hearing_date"),
+    ("Case Stage", "case_stage"),
+]
+
+
+def parse_status(soup):
+    status = {}
+    for row in soup.select("table.case_status_table tr"):
+        cells = row.find_all("td")
+        if len(cells) >= 2:
+            label = text_of(cells[0])
+            for needle, key in STATUS_LABELS:
+                if needle in label:
+                    status[key] = text_of(cells[1])
+                    break
+
+    if status.get("first_hearing_date", ""):
+        status["first_hearing_date"] = date_formate2(status["first_hearing_date"])
+
+    if status.get("decision_date", ""):
+        status["decision_date"] = date_formate2(status["decision_date"])
+
+    return status
+
+
+def parse_acts(soup):
+    acts = []
+    for row in soup.select("table.acts_table tr")[1:]:  # skip header
+        cells = row.find_all("td")
+        if len(cells) >= 2:
+            acts.append({"name": text_of(cells[0]), "sections": text_of(cells[1])})
+    return acts
+
+
+def history_rows(soup):
+    """
+    Body rows of the history table, the ones the browser path reads through
+    "table.history_table tbody tr". The parser only adds a <tbody> where the
+    page has one, so header rows are left out by their <thead> instead.
+    """
+    return [
+        row
+        for row in soup.select("table.history_table tr")
+        if row.find_parent("thead") is None
+    ]
+
+
+def parse_history(soup):
+    """
+    History rows without the business on date (that needs the row's link).
+    """
+    history = []
+    for row in history_rows(soup):
+        cells = row.find_all("td")
+        if len(cells) >= 4:
+            history.append(
+                {
+                    "judge": text_of(cells[0]),
+                    "date": text_of(cells[1]),
+                    "hearing_date": text_of(cells[2]),
+                    "purpose_of_hearing": text_of(cells[3]),
+                }
+            )
+    return history
+
+
+BUSINESS_LABELS = [
+    ("Business", "business"),
+    ("Next Purpose", "next_purpose"),
+    ("Next Hearing Date", "next_hearing_date"),
+    ("Nature of Disposal", "nature_of_disposal"),
+    ("Disposal Date", "disposal_date"),
+]
+
+
+def parse_business_on_date(html):
+    """
+    Parses the "business on date" panel (the caseBusinessDiv_caseType div or
+    the HTML fragment the portal returns for it).
+    """
+    soup = make_soup(html)
+    root = soup.select_one("#caseBusinessDiv_caseType") or soup
+    business = {}
+    for row in root.select("div center center table tr")[1:]:
+        cells = row.find_all("td")
+        if len(cells) < 3:
+            continue
+        label = text_of(cells[0])
+        for needle, key in BUSINESS_LABELS:
+            if needle in label:
+                business[key] = text_of(cells[2])
+                break
+    return business
+
+
+def parse_orders(soup):
+    """
+    Order rows (date and detail) without the PDF url.
+    """
+    orders = []
+    for table in soup.select("table.order_table"):
+        for row in table.find_all("tr")[1:]:  # skip header
+            cells = row.find_all("td")
+            if len(cells) >= 3:
+                orders.append({"date": text_of(cells[1]), "detail": text_of(cells[2])})
+    return orders
+
+
+def parse_case_links(html):
+    """
+    onclick handlers of the business on date links (one per parse_history
+    entry) and of the order links (one per parse_orders entry). None where a
+    row has no link.
+    """
+    soup = make_soup(html)
+
+    def onclick(cell):
+        link = cell.find("a")
+        return link.get("onclick") if link is not None else None
+
+    business = []
+    for row in history_rows(soup):
+        cells = row.find_all("td")
+        if len(cells) >= 4:
+            business.append(onclick(cells[1]))
+
+    orders = []
+    for table in soup.select("table.order_table"):
+        for row in table.find_all("tr")[1:]:
+            cells = row.find_all("td")
+            if len(cells) >= 3:
+                orders.append(onclick(cells[2]))
+
+    return {"business": business, "orders": orders}
+
+
+def parse_js_call(onclick):
+    """
+    Splits "viewHistory(123,'DLET01',2,...);return false;" into
+    ("viewHistory", ["123", "DLET01", "2", ...]). Commas and parentheses
+    inside quoted arguments (case types like 'CS (COMM)') stay in the argument.
+    """
+    match = re.search(r"(\w+)\s*\(", onclick or "")
+    if not match:
+        return None, []
+
+    args = []
+    current = []
+    started = False  # the current argument has a (possibly empty) quoted part
+    quote = None
+    depth = 0
+    chars = iter(onclick[match.end() :])
+    for char in chars:
+        if quote:
+            if char == "\\":
+                current.append(next(chars, ""))
+            elif char == quote:
+                quote = None
+            else:
+                current.append(char)
+        elif char in "'\"":
+            quote = char
+            started = True
+        elif char.isspace():
+            continue
+        elif char == "(":
+            depth += 1
+            current.append(char)
+        elif char == ")" and depth:
+            depth -= 1
+            current.append(char)
+        elif char == "," and depth:
+            current.append(char)
+        elif char == "," or char == ")":
+            if current or started or args or char == ",":
+                args.append("".join(current))
+            current = []
+            started = False
+            if char == ")":
+                return match.group(1), args
+        else:
+            current.append(char)
+    # No closing parenthesis
+    return None, []
+
+
+def cnr_from_onclick(onclick):
+    """
+    CNR number of a result row, taken from its viewHistory(...) call.
+    """
+    name, args = parse_js_call(onclick)
+    if name == "viewHistory" and len(args) > 1:
+        return args[1]
+    return None
+
+
+def parse_results_page(html):
+    """
+    One entry per "View" link of a search results page, in page order.
+    """
+    results = []
+    for link in make_soup(html).find_all("a", string=re.compile(r"^\s*View\s*$")):
+        row = link.find_parent("tr")
+        cells = row.find_all("td") if row is not None else []
+        results.append(
+            {
+                "index": len(results),
+                "case_number": text_of(cells[1]) if len(cells) > 1 else "",
+                "cnr_number": cnr_from_onclick(link.get("onclick", "")),
+                "onclick": link.get("onclick", ""),
+            }
+        )
+    return results
+
+
+def parse_case_details(html):
+    """
+    Builds the case_data dict from a case details page snapshot. Business on
+    date entries and order urls are left for the caller to fill in.
+    """
+    soup = make_soup(html)
+    return {
+        "details": parse_details(soup),
+        "status": parse_status(soup),
+        "petitioner_details": table_text(
+            soup.select_one("table.Petitioner_Advocate_table")
+        ),
+        "respondent_details": table_text(
+            soup.select_one("table.Respondent_Advocate_table")
+        ),
+        "acts": parse_acts(soup),
+        "history": parse_history(soup),
+        "orders": parse_orders(soup),
+    }
@@ -0,0 +1,140 @@
+"""
+Background order PDF pipeline.
+
+The scraper only records where an order PDF lives (url + session cookies) and
+moves on. A bounded pool of worker threads downloads each PDF from the portal
+into memory (blob names are content hashes, so the whole body is needed
+before the upload), uploads it and then patches the order's url into the
+stored case document. The scraper only blocks when the queue is full. PDFs
+the browser already holds (--capture-pdfs) are staged as bytes and only
+uploaded.
+"""
+
+import io
+import logging
+import queue
+import threading
+
+import requests
+
+from governor import get_governor
+from metrics import timed
+
+logger = logging.getLogger("scraper")
+
+_STOP = object()
+
+
+class PdfPipeline:
+    def __init__(
+        self, upload, patch, workers=4, queue_size=32, timeout=60, record=None
+    ):
+        """
+        upload(stream, details) -> blob url (or None on failure); reads the
+        whole stream
+        patch(cnr_number, order_index, url) stores the url in the case document
+        record(url, response) keeps the download for replay (--record)
+        """
+        self.upload = upload
+        self.patch = patch
+        self.record = record
+        self.timeout = timeout
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.staged = []
+        self.completed = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"pdf-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def begin_case(self):
+        """
+        Drops what a previous case staged but never committed (it was not
+        saved).
+        """
+        if self.staged:
+            logger.error(f"Dropping {len(self.staged)} order PDFs of an unsaved case")
+            self.staged = []
+
+    def stage(self, order_info, url, cookies, data=None):
+        """
+        Remembers an order PDF of the case currently being scraped, by url or
+        by its bytes (`data`). The order is stored with an empty url until its
+        upload finishes.
+        """
+        order_info["url"] = ""
+        self.staged.append((order_info, url, dict(cookies), data))
+
+    def commit(self, case_data):
+        """
+        Queues the staged PDFs of a case once its document has been saved.
+        """
+        staged, self.staged = self.staged, []
+        cnr_number = case_data.get("details", {}).get("cnr_number")
+        if not cnr_number:
+            if staged:
+                logger.error(f"Dropping {len(staged)} order PDFs of a case without CNR")
+            return
+
+        indexes = {id(order): i for i, order in enumerate(case_data.get("orders", []))}
+        for order_info, url, cookies, data in staged:
+            index = indexes.get(id(order_info))
+            if index is None:
+                logger.error(
+                    f"Order {order_info.get('date')} of {cnr_number} not found"
+                )
+                with self._lock:
+                    self.failed += 1
+                continue
+            # Blocks only while the queue is full
+            self.queue.put(
+                (cnr_number, index, url, cookies, data, case_data["details"])
+            )
+
+    def close(self):
+        """
+        Waits for every queued PDF to be uploaded and stops the workers.
+        """
+        for _ in self._threads:
+            self.queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+
+    def _worker(self):
+        session = requests.Session()
+        while True:
+            job = self.queue.get()
+            if job is _STOP:
+                return
+            cnr_number, index, url, cookies, data, details = job
+            try:
+                if data is not None:
+                    new_url = self.upload(io.BytesIO(data), details)
+                else:
+                    new_url = self._transfer(session, url, cookies, details)
+                self.patch(cnr_number, index, new_url or "")
+                with self._lock:
+                    if new_url:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+            except Exception as e:
+                with self._lock:
+                    self.failed += 1
+                logger.error(f"Error transferring order PDF {url} of {cnr_number}: {e}")
+
+    def _transfer(self, session, url, cookies, details):
+        session.cookies.clear()
+        for name, value in cookies.items():
+            session.cookies.set(name, value)
+        with timed("order_pdf"):
+            resp = get_governor().call(session.get, url, timeout=self.timeout)
+        if self.record is not None:
+            self.record(url, resp)
+        if resp.status_code != 200:
+            return None
+        return self.upload(io.BytesIO(resp.content), details)
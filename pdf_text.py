@@ -0,0 +1,89 @@
+"""
+Text of the order PDFs.
+
+Order PDFs are stored as opaque blobs, and many of them are scans.
+`python main.py --extract-text` reads the text of every stored order that has
+none yet, off the scraping path: the text layer of each page where there is
+one, Tesseract OCR of the rendered page where there is not. PDFs are
+downloaded and read on a process pool, one Tesseract thread per process.
+
+Blob names are content hashes, so results are cached by blob name and an
+order PDF attached to several cases (or re-scraped) is only read once.
+"""
+
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from blob_storage import download_pdf_bytes, reset_blob_client
+
+logger = logging.getLogger("scraper")
+
+# Pages with less text than this are treated as scanned and OCR'd
+MIN_PAGE_CHARS = 20
+
+OCR_DPI = 300
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+
+# Separates the pages in the extracted text
+PAGE_BREAK = "\f"
+
+
+def ocr_page(page):
+    import pytesseract
+    from PIL import Image
+
+    pixmap = page.get_pixmap(dpi=OCR_DPI, colorspace="gray")
+    image = Image.frombytes("L", (pixmap.width, pixmap.height), pixmap.samples)
+    return pytesseract.image_to_string(image, lang=OCR_LANG).strip()
+
+
+def extract_text(data):
+    """
+    {"text", "pages", "ocr_pages"} of a PDF given as bytes.
+    """
+    import pymupdf
+
+    pages = []
+    ocr_pages = 0
+    with pymupdf.open(stream=data, filetype="pdf") as document:
+        for page in document:
+            text = page.get_text().strip()
+            if len(text) < MIN_PAGE_CHARS:
+                scanned = ocr_page(page)
+                if len(scanned) > len(text):
+                    text = scanned
+                    ocr_pages += 1
+            pages.append(text)
+    return {"text": PAGE_BREAK.join(pages), "pages": len(pages), "ocr_pages": ocr_pages}
+
+
+def init_worker():
+    """
+    Runs once in every extraction process.
+    """
+    # The pool already keeps every core busy
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+    import pytesseract
+
+    from captcha_solver import TESSERACT_CMD
+
+    if TESSERACT_CMD:
+        pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+    reset_blob_client()
+
+
+def blob_text(blob_name):
+    """
+    extract_text() of a stored order PDF, or None if it could not be read.
+    """
+    try:
+        return extract_text(download_pdf_bytes(blob_name))
+    except Exception as e:
+        logger.error(f"Could not extract the text of {blob_name}: {e}")
+        return None
+
+
+def text_pool(workers=None):
+    return ProcessPoolExecutor(max_workers=workers, initializer=init_worker)
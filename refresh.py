@@ -0,0 +1,147 @@
+"""
+Incremental refresh of pending cases.
+
+Instead of re-crawling the whole docket, only cases whose next hearing date
+has passed (or that have not been looked at for `ttl`) are fetched again, by
+CNR number. New history rows and new orders are appended to the stored
+document and the status is updated in place; nothing else is rewritten.
+"""
+
+import logging
+from datetime import datetime, timedelta
+
+from parsing import (
+    next_hearing_at,
+    parse_business_on_date,
+    parse_case_details,
+    parse_case_links,
+)
+
+logger = logging.getLogger("scraper")
+
+
+def history_key(entry):
+    return (
+        entry.get("date"),
+        entry.get("hearing_date"),
+        entry.get("purpose_of_hearing"),
+    )
+
+
+def order_key(order):
+    return (order.get("date"), order.get("detail"))
+
+
+def due_query(now, ttl):
+    """
+    Pending cases whose hearing has happened since the last scrape, or whose
+    last scrape is older than `ttl`.
+    """
+    return {
+        "status.decision_date": {"$in": [None, ""]},
+        "$or": [
+            {"next_hearing_at": {"$lte": now}},
+            {"scraped_at": {"$lte": now - ttl}},
+            {"scraped_at": {"$exists": False}},
+        ],
+    }
+
+
+def refresh_update(stored, html, business_on_date, store_order):
+    """
+    Builds the Mongo update that brings `stored` up to date with the freshly
+    fetched case details page `html`.
+
+    business_on_date(link) -> dict for a new hearing row
+    store_order(link) -> blob url for a new order
+    """
+    fresh = parse_case_details(html)
+    fresh_links = parse_case_links(html)
+
+    known_history = {history_key(entry) for entry in stored.get("history", [])}
+    new_history = []
+    for entry, link in zip(fresh["history"], fresh_links["business"]):
+        if history_key(entry) in known_history:
+            continue
+        entry["business_on_date"] = business_on_date(link) if link else {}
+        new_history.append(entry)
+
+    known_orders = {order_key(order) for order in stored.get("orders", [])}
+    new_orders = []
+    for order, link in zip(fresh["orders"], fresh_links["orders"]):
+        if order_key(order) in known_orders:
+            continue
+        if link:
+            order["url"] = store_order(link) or ""
+        new_orders.append(order)
+
+    update = {
+        "$set": {
+            "status": fresh["status"],
+            "next_hearing_at": next_hearing_at(fresh["status"]),
+            "scraped_at": datetime.now(),
+        }
+    }
+    push = {}
+    if new_history:
+        push["history"] = {"$each": new_history}
+    if new_orders:
+        push["orders"] = {"$each": new_orders}
+    if push:
+        update["$push"] = push
+    return update, len(new_history), len(new_orders)
+
+
+def refresh_cases(
+    collection, http, submit_with_captcha, store_pdf, ttl_days=7, limit=0
+):
+    """
+    Re-fetches every due case through `http` (an EcourtsClient) and appends
+    what is new. `submit_with_captcha(http, submit)` runs a captcha protected
+    search; `store_pdf(data, details)` uploads an order PDF and returns its url.
+    Returns the number of refreshed cases.
+    """
+    now = datetime.now()
+    cursor = collection.find(
+        due_query(now, timedelta(days=ttl_days)), {"details.cnr_number": 1}
+    ).sort("next_hearing_at", 1)
+    if limit:
+        cursor = cursor.limit(limit)
+    # Fetching takes a while; don't keep the cursor open meanwhile
+    due = list(cursor)
+    print(f"{len(due)} cases due for refresh.")
+
+    http.bootstrap()
+    refreshed = 0
+    for entry in due:
+        cnr_number = entry.get("details", {}).get("cnr_number")
+        if not cnr_number:
+            continue
+        try:
+            html = submit_with_captcha(
+                http, lambda captcha: http.search_cnr(cnr_number, captcha)
+            )
+            stored = collection.find_one(
+                {"_id": entry["_id"]}, {"details": 1, "history": 1, "orders": 1}
+            )
+
+            def store_order(link):
+                data = http.order_pdf(link)
+                return store_pdf(data, stored["details"]) if data else ""
+
+            update, new_history, new_orders = refresh_update(
+                stored,
+                html,
+                lambda link: parse_business_on_date(http.business_on_date(link)),
+                store_order,
+            )
+            collection.update_one({"_id": stored["_id"]}, update)
+            refreshed += 1
+            print(
+                f"Refreshed {cnr_number}: {new_history} new hearings, "
+                f"{new_orders} new orders"
+            )
+        except Exception as e:
+            logger.error(f"Error refreshing {cnr_number}: {e}")
+
+    return refreshed
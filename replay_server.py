@@ -0,0 +1,231 @@
+"""
+Local stand-in for services.ecourts.gov.in.
+
+Serves back the responses recorded with EcourtsClient(record_dir=...), so the
+HTTP client can be exercised without touching the live portal:
+
+    python replay_server.py recordings/ --port 8765
+
+and then use EcourtsClient(base_url="http://127.0.0.1:8765/"). A browser crawl
+recorded with `main.py --record` (pages, scripts, XHRs and PDFs, see
+network_capture.py) is served at the root as well, so Chrome can be pointed
+at the same url. Links to the portal in the served pages point back here.
+
+--throttle-rate / --fail-rate answer that share of requests with a 429 or a
+503 instead, and --latency delays every response, to see how the request
+governor copes with an overloaded portal. benchmark.py runs the scraper
+against it.
+"""
+
+import argparse
+import base64
+import json
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+# Form fields that change on every request and are ignored when matching
+VOLATILE_FIELDS = {"app_token", "ajax_req", "ct_captcha_code"}
+
+# Replaced with the replay server's own origin in text responses
+PORTAL_ORIGIN = "https://services.ecourts.gov.in"
+TEXT_TYPES = ("text/", "javascript", "json", "xml")
+
+
+def load_recordings(recording_dir):
+    """
+    {(method, endpoint): [recording, ...]} in recording order.
+    """
+    recordings = defaultdict(list)
+    for name in sorted(os.listdir(recording_dir)):
+        if not name.endswith(".json"):
+            continue
+        with open(os.path.join(recording_dir, name), encoding="utf-8") as f:
+            recording = json.load(f)
+        recordings[(recording["method"], recording["endpoint"])].append(recording)
+    return recordings
+
+
+def best_match(candidates, data):
+    """
+    The recording whose form data agrees with `data` on the most fields.
+    """
+
+    def score(recording):
+        recorded = recording.get("data", {})
+        return sum(
+            1
+            for key, value in data.items()
+            if key not in VOLATILE_FIELDS and recorded.get(key) == value
+        )
+
+    return max(candidates, key=score)
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    recordings = {}
+    throttle_rate = 0.0
+    fail_rate = 0.0
+    latency = 0.0
+
+    def _endpoint(self):
+        url = urlsplit(self.path)
+        query = dict(parse_qsl(url.query))
+        return query.get("p") or url.path.lstrip("/")
+
+    def _inject_failure(self):
+        """
+        Answers with a 429 or 503 for the configured share of requests.
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        roll = random.random()
+        if roll < self.throttle_rate:
+            self.send_response(429)
+            self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return True
+        if roll < self.throttle_rate + self.fail_rate:
+            self.send_error(503, "Injected failure")
+            return True
+        return False
+
+    def _candidates(self, method):
+        endpoint = self._endpoint()
+        candidates = self.recordings.get((method, endpoint))
+        if candidates:
+            return candidates
+        # Pages link files by their full path (/ecourtindia_v6/js/...), which
+        # are recorded relative to the base path
+        parts = endpoint.split("/")
+        for i in range(1, len(parts)):
+            candidates = self.recordings.get((method, "/".join(parts[i:])))
+            if candidates:
+                return candidates
+        # Files fetched by absolute url (order PDFs) were recorded with the
+        # portal's host and base path in front
+        path = urlsplit(self.path).path
+        for (recorded_method, recorded), candidates in self.recordings.items():
+            if recorded_method != method or not recorded.startswith("http"):
+                continue
+            recorded_path = urlsplit(recorded).path
+            if recorded_path == path or (
+                endpoint and recorded_path.endswith(f"/{endpoint}")
+            ):
+                return candidates
+        return None
+
+    def _rewrite(self, body, content_type):
+        """
+        Points the portal's absolute urls in a text response at this server.
+        """
+        if not any(kind in content_type for kind in TEXT_TYPES):
+            return body
+        origin = f"http://{self.headers.get('Host', '')}".encode("ascii")
+        portal = PORTAL_ORIGIN.encode("ascii")
+        body = body.replace(portal, origin)
+        # The same urls inside JSON strings
+        return body.replace(portal.replace(b"/", b"\\/"), origin.replace(b"/", b"\\/"))
+
+    def _replay(self, method, data):
+        if self._inject_failure():
+            return
+        candidates = self._candidates(method)
+        if not candidates:
+            self.send_error(404, f"No recording for {method} {self._endpoint()}")
+            return
+        recording = best_match(candidates, data)
+        content_type = recording.get("content_type") or "application/json"
+        body = self._rewrite(base64.b64decode(recording["body"]), content_type)
+        self.send_response(recording.get("status", 200))
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._replay("GET", {})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        data = dict(parse_qsl(self.rfile.read(length).decode("utf-8")))
+        self._replay("POST", data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(
+    recording_dir,
+    host="127.0.0.1",
+    port=0,
+    throttle_rate=0.0,
+    fail_rate=0.0,
+    latency=0.0,
+):
+    """
+    Builds a replay server; port 0 picks a free port (see server.server_port).
+    """
+    handler = type(
+        "Handler",
+        (ReplayHandler,),
+        {
+            "recordings": load_recordings(recording_dir),
+            "throttle_rate": throttle_rate,
+            "fail_rate": fail_rate,
+            "latency": latency,
+        },
+    )
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def start_in_background(recording_dir, host="127.0.0.1", port=0, **failures):
+    """
+    Starts a replay server on a daemon thread and returns it together with
+    the base url to hand to EcourtsClient.
+    """
+    server = make_server(recording_dir, host, port, **failures)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}/"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded eCourts responses")
+    parser.add_argument("recording_dir")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--throttle-rate",
+        type=float,
+        default=0.0,
+        help="Share of requests answered with 429 (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--fail-rate",
+        type=float,
+        default=0.0,
+        help="Share of requests answered with 503 (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Seconds added to every response (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    server = make_server(
+        args.recording_dir,
+        args.host,
+        args.port,
+        throttle_rate=args.throttle_rate,
+        fail_rate=args.fail_rate,
+        latency=args.latency,
+    )
+    print(f"Replaying {args.recording_dir} on http://{args.host}:{server.server_port}/")
+    server.serve_forever()
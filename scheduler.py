@@ -0,0 +1,308 @@
+"""
+Crawl scheduling: which searches to run, and who runs them.
+
+A crawl config names the courts, case types, years and case statuses to
+scrape. It is a JSON file like
+
+    {
+        "courts": {"Delhi": {"East": ["Karkardooma Court Complex"], "West": "*"}},
+        "case_types": "*",
+        "years": ["2023", "2024"],
+        "statuses": ["radDCT", "radPCT"]
+    }
+
+where "*" stands for everything the portal offers at that level (all
+districts of a state, all complexes of a district, all case types of a
+complex). expand_jobs() turns it into one Job per state x district x complex
+x case type x year x status (x shard).
+
+JobQueue keeps the jobs in a Mongo collection. Any number of worker processes
+on any number of machines claim a job with a lease, keep the lease alive with
+a heartbeat while they scrape, and mark it done. A job whose worker died is
+claimed again once its lease expires. Every job carries the crawl (the time
+it was last reset to pending) it belongs to, which workers key their local
+checkpoints by.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+logger = logging.getLogger("scraper")
+
+Job = namedtuple(
+    "Job",
+    [
+        "state",
+        "district",
+        "court_complex",
+        "case_type",
+        "status",
+        "year",
+        "shard",
+        "shards",
+    ],
+)
+
+# Queue states
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+def describe(job):
+    label = f"{job.court_complex} / {job.case_type} / {job.status} / {job.year}"
+    return f"{label} / {job.shard + 1} of {job.shards}" if job.shards > 1 else label
+
+
+def load_config(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# Expanding a config #############################################
+class PortalCatalog:
+    """
+    Looks up districts, court complexes and case types on the portal for the
+    "*" entries of a config. Every list is fetched once.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._states = None
+        self._districts = {}
+        self._complexes = {}
+
+    def states(self):
+        if self._states is None:
+            self._states = self.client.bootstrap()
+        return self._states
+
+    def districts(self, state):
+        if state not in self._districts:
+            self._districts[state] = self.client.districts(self.states()[state])
+        return self._districts[state]
+
+    def complexes(self, state, district):
+        key = (state, district)
+        if key not in self._complexes:
+            self._complexes[key] = self.client.court_complexes(
+                self.states()[state], self.districts(state)[district]
+            )
+        return self._complexes[key]
+
+    def case_types(self, state, district, court_complex):
+        self.client.set_location(
+            self.states()[state],
+            self.districts(state)[district],
+            self.complexes(state, district)[court_complex],
+        )
+        return self.client.case_types()
+
+
+def expand_jobs(config, catalog=None, shards=1):
+    """
+    One Job per search of the config. `catalog` (a PortalCatalog) is needed
+    when the config uses "*".
+    """
+
+    def everything(what):
+        if catalog is None:
+            raise ValueError(f'"*" {what} in the crawl config needs the portal')
+
+    jobs = []
+    for state, districts in config["courts"].items():
+        if districts == "*":
+            everything("districts")
+            districts = {district: "*" for district in catalog.districts(state)}
+        for district, complexes in districts.items():
+            if complexes == "*":
+                everything("court complexes")
+                complexes = list(catalog.complexes(state, district))
+            for court_complex in complexes:
+                case_types = config["case_types"]
+                if case_types == "*":
+                    everything("case types")
+                    case_types = list(
+                        catalog.case_types(state, district, court_complex)
+                    )
+                jobs.extend(
+                    Job(
+                        state,
+                        district,
+                        court_complex,
+                        case_type,
+                        status,
+                        str(year),
+                        shard,
+                        shards,
+                    )
+                    for case_type in case_types
+                    for year in config["years"]
+                    for status in config["statuses"]
+                    for shard in range(shards)
+                )
+    return jobs
+
+
+# Shared queue ###################################################
+class JobQueue:
+    def __init__(self, collection, lease_seconds=600, max_attempts=3):
+        from pymongo import ASCENDING
+
+        self.collection = collection
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        collection.create_index(
+            [("status", ASCENDING), ("lease_until", ASCENDING)], name="claim"
+        )
+
+    def enqueue(self, jobs, key, restart=False):
+        """
+        Adds the jobs that are not queued yet (`key(job)` is their id). When
+        every one of them has run already, or with `restart`, they are all
+        reset to start a new crawl. Returns the number of open jobs.
+        """
+        from pymongo import UpdateOne
+
+        now = time.time()
+        keys = [key(job) for job in jobs]
+        if jobs:
+            self.collection.bulk_write(
+                [
+                    UpdateOne(
+                        {"_id": job_key},
+                        {
+                            "$setOnInsert": {
+                                "job": job._asdict(),
+                                "status": PENDING,
+                                "attempts": 0,
+                                "created_at": now,
+                                "crawl": now,
+                            }
+                        },
+                        upsert=True,
+                    )
+                    for job, job_key in zip(jobs, keys)
+                ],
+                ordered=False,
+            )
+
+        open_jobs = {"_id": {"$in": keys}, "status": {"$in": [PENDING, LEASED]}}
+        if restart or not self.collection.count_documents(open_jobs):
+            self.collection.update_many(
+                {"_id": {"$in": keys}},
+                {
+                    "$set": {
+                        "status": PENDING,
+                        "attempts": 0,
+                        "created_at": now,
+                        "crawl": now,
+                    },
+                    "$unset": {"owner": "", "lease_until": "", "error": ""},
+                },
+            )
+        return self.collection.count_documents(open_jobs)
+
+    def claim(self, owner):
+        """
+        Leases the oldest pending (or abandoned) job to `owner`. Returns
+        (key, Job, crawl), or None when there is nothing left to do.
+        """
+        from pymongo import ASCENDING, ReturnDocument
+
+        while True:
+            now = time.time()
+            doc = self.collection.find_one_and_update(
+                {
+                    "$or": [
+                        {"status": PENDING},
+                        {"status": LEASED, "lease_until": {"$lt": now}},
+                    ]
+                },
+                {
+                    "$set": {
+                        "status": LEASED,
+                        "owner": owner,
+                        "lease_until": now + self.lease_seconds,
+                        "heartbeat_at": now,
+                    },
+                    "$inc": {"attempts": 1},
+                },
+                sort=[("created_at", ASCENDING)],
+                return_document=ReturnDocument.AFTER,
+            )
+            if doc is None:
+                return None
+            if doc["attempts"] > self.max_attempts:
+                # Its workers keep dying; don't let it take the crawl down
+                self.collection.update_one(
+                    {"_id": doc["_id"]}, {"$set": {"status": FAILED}}
+                )
+                logger.error(f"Job {doc['_id']} failed {self.max_attempts} times")
+                continue
+            # Jobs queued before crawls were recorded
+            crawl = doc.get("crawl", doc["created_at"])
+            return doc["_id"], Job(**doc["job"]), crawl
+
+    def renew(self, key, owner):
+        """
+        Extends the lease. False if the job was taken over meanwhile.
+        """
+        now = time.time()
+        result = self.collection.update_one(
+            {"_id": key, "owner": owner, "status": LEASED},
+            {"$set": {"lease_until": now + self.lease_seconds, "heartbeat_at": now}},
+        )
+        return result.matched_count == 1
+
+    @contextmanager
+    def heartbeat(self, key, owner):
+        """
+        Keeps renewing the lease of `key` while the block runs.
+        """
+        stop = threading.Event()
+
+        def _beat():
+            while not stop.wait(self.lease_seconds / 3):
+                try:
+                    if not self.renew(key, owner):
+                        logger.warning(f"Lost the lease of job {key}")
+                        return
+                except Exception as e:
+                    logger.error(f"Could not renew the lease of job {key}: {e}")
+
+        thread = threading.Thread(target=_beat, name="lease-heartbeat", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def complete(self, key, owner, cases):
+        self.collection.update_one(
+            {"_id": key, "owner": owner},
+            {
+                "$set": {"status": DONE, "finished_at": time.time(), "cases": cases},
+                "$unset": {"lease_until": ""},
+            },
+        )
+
+    def release(self, key, owner, error=""):
+        """
+        Gives a job that did not finish back to the queue, or marks it failed
+        once it used up its attempts.
+        """
+        doc = self.collection.find_one({"_id": key, "owner": owner}, {"attempts": 1})
+        if doc is None:
+            return
+        status = FAILED if doc["attempts"] >= self.max_attempts else PENDING
+        self.collection.update_one(
+            {"_id": key, "owner": owner},
+            {"$set": {"status": status, "error": error}, "$unset": {"lease_until": ""}},
+        )
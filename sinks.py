@@ -0,0 +1,319 @@
+"""
+Local case sinks for bulk crawls, and the loader that brings them into Mongo.
+
+With --sink jsonl:DIR or --sink parquet:DIR a crawl writes its cases to local
+files instead of sending a bulk_write to Mongo every few cases, so it runs at
+scraping speed. Loading the database is a separate batch step:
+
+    python main.py --load DIR
+
+Sinks are BulkWriters that store each batch in a new file rather than in
+Mongo: cases are buffered the same way, patches to a buffered case are applied
+in memory, and the on_stored callbacks (checkpoints) run once the file is
+written. Every flush rolls a new file, named by time and process:
+
+    DIR/<stamp>.cases.jsonl.gz     one case per line, MongoDB extended JSON
+    DIR/<stamp>.cases.parquet      one row per case, nested columns (the
+                                   fields parsing.py builds, nothing else)
+    DIR/<stamp>.patches.jsonl.gz   patches to cases of earlier files
+
+Files are written under a .tmp name and renamed once complete. The loader
+applies them in name order with large unordered bulk writes and moves every
+loaded file to DIR/loaded/.
+"""
+
+import argparse
+import glob
+import gzip
+import logging
+import os
+import shutil
+import threading
+from datetime import datetime
+
+from metrics import count, timed
+from mongo_writer import CNR_FIELD, BulkWriter, ensure_indexes
+from parsing import BUSINESS_LABELS, STATUS_LABELS
+
+logger = logging.getLogger("scraper")
+
+# Cases per file (and per loader bulk write)
+BATCH_SIZE = int(os.getenv("SINK_BATCH_SIZE", "1000"))
+FLUSH_INTERVAL = float(os.getenv("SINK_FLUSH_INTERVAL", "60"))
+
+_seq = 0
+_seq_lock = threading.Lock()
+
+
+def file_stamp():
+    """
+    Sorts files in the order they were written, across processes.
+    """
+    global _seq
+
+    with _seq_lock:
+        _seq += 1
+        seq = _seq
+    return f"{datetime.now():%Y%m%dT%H%M%S%f}-{os.getpid()}-{seq:06d}"
+
+
+def write_atomically(path, write):
+    tmp_path = f"{path}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+# JSON lines #####################################################
+def write_jsonl(path, rows):
+    from bson import json_util
+
+    def _write(tmp_path):
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json_util.dumps(row))
+                f.write("\n")
+
+    write_atomically(path, _write)
+
+
+def read_jsonl(path):
+    from bson import json_util
+
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return [json_util.loads(line) for line in f if line.strip()]
+
+
+# Parquet ########################################################
+def case_schema():
+    """
+    Arrow schema of a case document, as built by parsing.py.
+    """
+    import pyarrow as pa
+
+    def strings(*names):
+        return [(name, pa.string()) for name in names]
+
+    business = pa.struct(strings(*(key for _, key in BUSINESS_LABELS)))
+    return pa.schema(
+        [
+            (
+                "details",
+                pa.struct(
+                    strings(
+                        "case_type",
+                        "filing_number",
+                        "filing_date",
+                        "registration_number",
+                        "registration_date",
+                        "cnr_number",
+                    )
+                ),
+            ),
+            ("status", pa.struct(strings(*(key for _, key in STATUS_LABELS)))),
+            *strings("petitioner_details", "respondent_details"),
+            ("acts", pa.list_(pa.struct(strings("name", "sections")))),
+            (
+                "history",
+                pa.list_(
+                    pa.struct(
+                        strings("judge", "date", "hearing_date", "purpose_of_hearing")
+                        + [("business_on_date", business)]
+                    )
+                ),
+            ),
+            ("orders", pa.list_(pa.struct(strings("date", "detail", "url", "text")))),
+            *strings("state", "district", "court_complex"),
+            ("next_hearing_at", pa.timestamp("ms")),
+            ("scraped_at", pa.timestamp("ms")),
+        ]
+    )
+
+
+def write_parquet(path, rows):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pylist(rows, schema=case_schema())
+    write_atomically(path, lambda tmp_path: pq.write_table(table, tmp_path))
+
+
+def drop_nulls(value):
+    """
+    Parquet structs have every field; leaves out the ones the case did not
+    have, so loaded documents look like scraped ones.
+    """
+    if isinstance(value, dict):
+        return {k: drop_nulls(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [drop_nulls(v) for v in value]
+    return value
+
+
+def read_parquet(path):
+    import pyarrow.parquet as pq
+
+    return [
+        {key: drop_nulls(value) for key, value in row.items()}
+        for row in pq.read_table(path).to_pylist()
+    ]
+
+
+# Sinks ##########################################################
+class FileSink(BulkWriter):
+    kind = None
+    extension = None
+    write_cases = None  # write_cases(path, rows), set by every sink
+
+    def __init__(self, directory, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.files = 0
+        super().__init__(None, batch_size=batch_size, flush_interval=flush_interval)
+
+    def write_batch(self, docs, patches):
+        stamp = file_stamp()
+        rows = list(docs.values())
+        try:
+            with timed("sink_write"):
+                if rows:
+                    self.write_cases(
+                        os.path.join(self.directory, f"{stamp}.cases{self.extension}"),
+                        rows,
+                    )
+                    self.files += 1
+                if patches:
+                    write_jsonl(
+                        os.path.join(self.directory, f"{stamp}.patches.jsonl.gz"),
+                        [
+                            {"cnr_number": cnr_number, "fields": fields}
+                            for cnr_number, fields in patches
+                        ],
+                    )
+                    self.files += 1
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Could not write a batch to {self.directory}: {e}")
+            count("sink_errors")
+            return False
+        count("sink_writes", len(rows) + len(patches))
+        return True
+
+    def report(self):
+        return (
+            f"{self.kind}: {self.written} writes in {self.files} files, "
+            f"{self.errors} errors"
+        )
+
+
+class JsonlSink(FileSink):
+    kind = "jsonl"
+    extension = ".jsonl.gz"
+    write_cases = staticmethod(write_jsonl)
+
+
+class ParquetSink(FileSink):
+    kind = "parquet"
+    extension = ".parquet"
+    write_cases = staticmethod(write_parquet)
+
+
+SINKS = {sink.kind: sink for sink in (JsonlSink, ParquetSink)}
+
+
+def parse_sink(spec):
+    """
+    argparse type of --sink: "jsonl:DIR" or "parquet:DIR" -> (kind, DIR).
+    """
+    kind, _, directory = spec.partition(":")
+    if kind not in SINKS or not directory:
+        raise argparse.ArgumentTypeError(
+            f"expected {' or '.join(f'{kind}:DIR' for kind in SINKS)}, got {spec!r}"
+        )
+    return kind, directory
+
+
+def open_sink(kind, directory):
+    return SINKS[kind](directory)
+
+
+# Loading ########################################################
+def sink_files(directory):
+    """
+    Complete sink files of `directory` in the order they have to be applied.
+    """
+    paths = []
+    for pattern in ("*.cases.jsonl.gz", "*.cases.parquet", "*.patches.jsonl.gz"):
+        paths.extend(glob.glob(os.path.join(directory, pattern)))
+    # A batch's cases come before its patches
+    return sorted(paths, key=lambda path: os.path.basename(path).split(".", 2)[:2])
+
+
+def load(directory, collection, batch_size=BATCH_SIZE):
+    """
+    Pushes every sink file of `directory` into the collection with unordered
+    bulk writes of `batch_size` operations. Returns the number of writes.
+    """
+    from pymongo import InsertOne, ReplaceOne, UpdateOne
+
+    ensure_indexes(collection)
+    loaded_dir = os.path.join(directory, "loaded")
+    os.makedirs(loaded_dir, exist_ok=True)
+
+    written = 0
+    cases = {}  # cnr_number -> the newest document
+    inserts = []
+    pending = []  # files whose cases are not written yet
+
+    def done(paths):
+        for path in paths:
+            shutil.move(path, os.path.join(loaded_dir, os.path.basename(path)))
+
+    def write(operations):
+        nonlocal written
+        for i in range(0, len(operations), batch_size):
+            with timed("bulk_load"):
+                collection.bulk_write(operations[i : i + batch_size], ordered=False)
+            written += len(operations[i : i + batch_size])
+            print(f"Loaded: {written}", end="\r")
+        count("load_writes", len(operations))
+
+    def write_cases():
+        # Unordered writes must not contain the same case twice
+        write(
+            [
+                ReplaceOne({CNR_FIELD: cnr_number}, doc, upsert=True)
+                for cnr_number, doc in cases.items()
+            ]
+            + [InsertOne(doc) for doc in inserts]
+        )
+        cases.clear()
+        inserts.clear()
+        done(pending)
+        pending.clear()
+
+    paths = sink_files(directory)
+    print(f"Loading {len(paths)} files from {directory}.")
+    for path in paths:
+        if path.endswith(".patches.jsonl.gz"):
+            # Patches apply to the cases of every earlier file
+            write_cases()
+            write(
+                [
+                    UpdateOne({CNR_FIELD: row["cnr_number"]}, {"$set": row["fields"]})
+                    for row in read_jsonl(path)
+                ]
+            )
+            done([path])
+        else:
+            rows = read_parquet(path) if path.endswith(".parquet") else read_jsonl(path)
+            for doc in rows:
+                cnr_number = doc.get("details", {}).get("cnr_number")
+                if cnr_number:
+                    cases[cnr_number] = doc
+                else:
+                    inserts.append(doc)
+            pending.append(path)
+            if len(cases) + len(inserts) >= batch_size:
+                write_cases()
+    write_cases()
+    return written
@@ -0,0 +1,62 @@
+from ecourts_client import EcourtsClient, EcourtsError, NoRecordsError
+
+
+class FlakyBusinessClient(EcourtsClient):
+    """
+    Serves business on date pages without the portal; the links in `broken`
+    fail every time.
+    """
+
+    def __init__(self, broken=()):
+        super().__init__()
+        self.broken = set(broken)
+        self.calls = []
+
+    def business_on_date(self, onclick):
+        self.calls.append(onclick)
+        if onclick in self.broken:
+            raise EcourtsError("POST home/viewBusiness returned 500")
+        return f"<p>{onclick}</p>"
+
+
+class FakeDriver:
+    def __init__(self):
+        self.scripts = []
+
+    def execute_script(self, script, *args):
+        self.scripts.append(args)
+
+
+def test_failed_business_page_is_left_blank():
+    http = FlakyBusinessClient(broken={"b"})
+    pages = http.business_on_dates(["a", None, "b", "c"], workers=4)
+
+    assert pages == ["<p>a</p>", "", "", "<p>c</p>"]
+    # b failed concurrently and once more on its own
+    assert http.calls.count("b") == 2
+
+
+def test_sequential_failure_does_not_raise():
+    http = FlakyBusinessClient(broken={"a"})
+    assert http.business_on_dates(["a", "b"], workers=1) == ["", "<p>b</p>"]
+
+
+def test_token_of_concurrent_requests_is_not_synced_back():
+    http = FlakyBusinessClient()
+    http.app_token = "token"
+    http.business_on_dates(["a", "b"], workers=2)
+
+    driver = FakeDriver()
+    http.sync_driver(driver)
+    assert http.token_stale
+    assert driver.scripts == []
+
+
+def test_search_without_results_returns_no_page(monkeypatch):
+    http = EcourtsClient()
+
+    def post(endpoint, data):
+        raise NoRecordsError("Record not found")
+
+    monkeypatch.setattr(http, "post", post)
+    assert http.search_case_type("CS", "2024", "radPCT", "abc12") == ""
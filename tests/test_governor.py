@@ -0,0 +1,161 @@
+import json
+import random
+import time
+
+import pytest
+
+from ecourts_client import VIEW_BUSINESS, EcourtsClient, EcourtsError, save_recording
+from governor import configure, get_governor
+from pdf_pipeline import PdfPipeline
+from replay_server import start_in_background
+
+ONCLICK = "viewBusiness('2','26','10-01-2024','CS/101/2024',1)"
+PDF = b"%PDF-1.4 order"
+
+
+@pytest.fixture
+def recordings(tmp_path):
+    save_recording(
+        str(tmp_path),
+        "POST",
+        VIEW_BUSINESS,
+        {"court_code": "2"},
+        200,
+        "application/json",
+        json.dumps({"data_list": "<p>business</p>", "app_token": "t1"}).encode(),
+    )
+    save_recording(
+        str(tmp_path), "GET", "orders/1.pdf", None, 200, "application/pdf", PDF
+    )
+    return str(tmp_path)
+
+
+@pytest.fixture
+def governor():
+    # Short back-off so retries don't slow the tests down
+    configure(rate=100.0, burst=100, max_retries=2, backoff=0.01, max_backoff=0.05)
+    yield get_governor()
+    configure()
+
+
+@pytest.fixture
+def portal(recordings):
+    servers = []
+
+    def start(**failures):
+        server, base_url = start_in_background(recordings, **failures)
+        servers.append(server)
+        return server, base_url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_failed_requests_are_retried_until_they_succeed(governor, portal):
+    random.seed(1)
+    _, base_url = portal(fail_rate=0.5)
+    http = EcourtsClient(base_url=base_url)
+    governor.max_retries = 10
+
+    pages = [http.business_on_date(ONCLICK) for _ in range(20)]
+
+    assert pages == ["<p>business</p>"] * 20
+    assert governor.retries > 0
+    assert governor.calls == 20 + governor.retries
+
+
+def test_failing_portal_backs_off_and_gives_up(governor, portal):
+    _, base_url = portal(fail_rate=1.0)
+    http = EcourtsClient(base_url=base_url)
+
+    with pytest.raises(EcourtsError, match="503"):
+        http.business_on_date(ONCLICK)
+
+    assert governor.calls == 3
+    assert governor.retries == 2
+    # Failures within a second halve the limits once
+    assert governor.decreases == 1
+    assert governor.rate == 50.0
+    assert governor.limit == 4.0
+
+
+def test_throttled_request_waits_for_retry_after(governor, portal):
+    _, base_url = portal(throttle_rate=1.0)
+    http = EcourtsClient(base_url=base_url)
+    governor.max_retries = 1
+
+    start = time.monotonic()
+    with pytest.raises(EcourtsError, match="429"):
+        http.business_on_date(ONCLICK)
+
+    assert time.monotonic() - start >= 1.0
+    assert governor.throttled == 2
+
+
+def test_successes_raise_the_limits_again(governor, portal):
+    server, base_url = portal(fail_rate=1.0)
+    http = EcourtsClient(base_url=base_url)
+    with pytest.raises(EcourtsError):
+        http.business_on_date(ONCLICK)
+    rate, limit = governor.rate, governor.limit
+
+    server.RequestHandlerClass.fail_rate = 0.0
+    for _ in range(5):
+        http.business_on_date(ONCLICK)
+
+    assert governor.rate > rate
+    assert governor.limit > limit
+
+
+def test_pdf_pipeline_downloads_through_the_governor(governor, portal):
+    random.seed(1)
+    _, base_url = portal(fail_rate=0.3)
+    governor.max_retries = 10
+    uploads = []
+    patches = []
+
+    def upload(stream, details):
+        uploads.append(stream.read())
+        return f"https://blob/{len(uploads)}.pdf"
+
+    pipeline = PdfPipeline(
+        upload, lambda *args: patches.append(args), workers=2, timeout=5
+    )
+    case_data = {
+        "details": {"cnr_number": "A"},
+        "orders": [{"date": "10-01-2024"}, {"date": "11-01-2024"}],
+    }
+    for order_info in case_data["orders"]:
+        pipeline.stage(order_info, f"{base_url}orders/1.pdf", {"PHPSESSID": "x"})
+    pipeline.commit(case_data)
+    pipeline.close()
+
+    assert uploads == [PDF, PDF]
+    assert sorted(patch[:2] for patch in patches) == [("A", 0), ("A", 1)]
+    assert {patch[2] for patch in patches} == {
+        "https://blob/1.pdf",
+        "https://blob/2.pdf",
+    }
+    assert pipeline.completed == 2
+
+
+def test_pdf_pipeline_counts_downloads_that_keep_failing(governor, portal):
+    _, base_url = portal(fail_rate=1.0)
+    uploads = []
+    patches = []
+    pipeline = PdfPipeline(
+        lambda stream, details: uploads.append(stream),
+        lambda *args: patches.append(args),
+        workers=1,
+        timeout=5,
+    )
+    case_data = {"details": {"cnr_number": "A"}, "orders": [{"date": "10-01-2024"}]}
+    pipeline.stage(case_data["orders"][0], f"{base_url}orders/1.pdf", {})
+    pipeline.commit(case_data)
+    pipeline.close()
+
+    assert uploads == []
+    assert patches == [("A", 0, "")]
+    assert pipeline.failed == 1
@@ -0,0 +1,204 @@
+import mongomock
+import pytest
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from mongo_writer import BulkWriter
+
+
+class FlakyCollection:
+    """
+    A mongomock collection whose next `failures` bulk writes raise `error`.
+
+    mongomock's own bulk_write does not take the operations of pymongo 4.11,
+    so they are applied one by one.
+    """
+
+    def __init__(self, collection, failures=0, error=None):
+        self.collection = collection
+        self.failures = failures
+        self.error = error or AutoReconnect("connection reset")
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def bulk_write(self, operations, ordered=True):
+        if self.failures:
+            self.failures -= 1
+            raise self.error
+        for op in operations:
+            if isinstance(op, ReplaceOne):
+                self.collection.replace_one(op._filter, op._doc, upsert=op._upsert)
+            elif isinstance(op, UpdateOne):
+                self.collection.update_one(op._filter, op._doc)
+
+
+def case(cnr_number, status="Pending"):
+    return {
+        "details": {"cnr_number": cnr_number},
+        "status": {"case_status": status},
+        "orders": [{"date": "01-02-2024", "url": ""}],
+    }
+
+
+@pytest.fixture
+def collection():
+    return FlakyCollection(mongomock.MongoClient().db.cases)
+
+
+def make_writer(collection, **kwargs):
+    # A long interval keeps the periodic flush out of the way
+    kwargs.setdefault("flush_interval", 3600)
+    return BulkWriter(collection, **kwargs)
+
+
+def stored(collection, cnr_number):
+    return collection.find_one({"details.cnr_number": cnr_number}, {"_id": 0})
+
+
+def test_cases_are_buffered_and_upserted_on_cnr(collection):
+    writer = make_writer(collection)
+    writer.write(case("A", "Pending"))
+    writer.write(case("A", "Disposed"))
+
+    assert collection.count_documents({}) == 0
+    assert writer.pending() == 1
+
+    assert writer.flush()
+    assert collection.count_documents({}) == 1
+    assert stored(collection, "A")["status"]["case_status"] == "Disposed"
+
+    writer.write(case("A", "Pending"))
+    writer.flush()
+    assert collection.count_documents({"details.cnr_number": "A"}) == 1
+
+
+def test_case_without_cnr_is_not_stored(collection):
+    writer = make_writer(collection)
+    calls = []
+
+    assert not writer.write({"details": {}, "status": {}}, on_stored=calls.append)
+    assert not writer.write({}, on_stored=calls.append)
+    assert writer.pending() == 0
+
+    writer.flush()
+    assert collection.count_documents({}) == 0
+    assert calls == []
+
+
+def test_full_batch_is_flushed(collection):
+    writer = make_writer(collection, batch_size=2)
+    writer.write(case("A"))
+    assert writer.pending() == 1
+    writer.write(case("B"))
+    assert writer.pending() == 0
+    assert collection.count_documents({}) == 2
+
+
+def test_patch_of_a_buffered_case_is_applied_in_memory(collection):
+    writer = make_writer(collection)
+    writer.write(case("A"))
+    writer.patch("A", {"orders.0.url": "https://blob/a.pdf"})
+
+    assert writer.patches == []
+    writer.flush()
+    assert stored(collection, "A")["orders"][0]["url"] == "https://blob/a.pdf"
+
+
+def test_patch_of_a_stored_case_goes_with_the_next_batch(collection):
+    writer = make_writer(collection)
+    writer.write(case("A"))
+    writer.flush()
+
+    writer.patch("A", {"orders.0.url": "https://blob/a.pdf"})
+    assert writer.pending() == 1
+    writer.flush()
+    assert stored(collection, "A")["orders"][0]["url"] == "https://blob/a.pdf"
+
+
+def test_new_document_replaces_pending_patches(collection):
+    writer = make_writer(collection)
+    writer.write(case("A"))
+    writer.flush()
+
+    writer.patch("A", {"orders.0.url": "https://blob/old.pdf"})
+    writer.write(case("A", "Disposed"))
+    assert writer.patches == []
+    writer.flush()
+    assert stored(collection, "A")["orders"][0]["url"] == ""
+
+
+def test_callbacks_run_once_the_batch_is_stored(collection):
+    writer = make_writer(collection)
+    calls = []
+    writer.write(case("A"), on_stored=lambda: calls.append("A"))
+    writer.write(case("B"), on_stored=lambda: calls.append("B"))
+
+    assert calls == []
+    writer.flush()
+    assert calls == ["A", "B"]
+    writer.flush()
+    assert calls == ["A", "B"]
+
+
+def test_failed_batch_is_kept_and_sent_again(collection):
+    writer = make_writer(collection)
+    calls = []
+    writer.write(case("A"), on_stored=lambda: calls.append("A"))
+    writer.flush()
+    collection.failures = 1
+    writer.patch("A", {"orders.0.url": "https://blob/a.pdf"})
+    writer.write(case("B"), on_stored=lambda: calls.append("B"))
+
+    assert not writer.flush()
+    assert writer.pending() == 2
+    assert calls == ["A"]
+    assert writer.errors == 1
+    assert writer.retries == 1
+
+    assert writer.flush()
+    assert writer.pending() == 0
+    assert calls == ["A", "B"]
+    assert stored(collection, "A")["orders"][0]["url"] == "https://blob/a.pdf"
+    assert stored(collection, "B") is not None
+
+
+def test_failed_batch_waits_before_it_is_retried(collection):
+    collection.failures = 1
+    writer = make_writer(collection, batch_size=1)
+    writer.write(case("A"))
+    assert writer.pending() == 1
+
+    # Within the retry delay a full buffer is not flushed again
+    writer.write(case("B"))
+    assert writer.pending() == 2
+    assert collection.failures == 0
+    assert collection.count_documents({}) == 0
+
+
+def test_rejected_batch_drops_its_callbacks(collection):
+    collection.failures = 1
+    collection.error = BulkWriteError(
+        {"writeErrors": [{"index": 0, "errmsg": "duplicate"}]}
+    )
+    writer = make_writer(collection)
+    calls = []
+    writer.write(case("A"), on_stored=lambda: calls.append("A"))
+
+    assert not writer.flush()
+    assert writer.pending() == 0
+    assert calls == []
+    assert writer.failed == 1
+    assert writer.errors == 1
+
+
+def test_close_retries_a_failed_batch(collection):
+    collection.failures = 2
+    writer = make_writer(collection)
+    writer.flush_interval = 0.01
+    calls = []
+    writer.write(case("A"), on_stored=lambda: calls.append("A"))
+
+    writer.close()
+    assert calls == ["A"]
+    assert stored(collection, "A") is not None
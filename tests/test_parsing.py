@@ -0,0 +1,194 @@
+from urllib.parse import parse_qsl
+
+import pytest
+
+from ecourts_client import VIEW_HISTORY_ARGS, js_call_params
+from parsing import (
+    cnr_from_onclick,
+    parse_case_details,
+    parse_case_links,
+    parse_js_call,
+)
+
+# A case details page as the portal renders it (trimmed to the parsed parts)
+CASE_PAGE = """
+<div id="history_cnr">
+<table class="table case_details_table">
+  <tr><td colspan="3" class="fw-bold text-uppercase">CS - Civil Suit</td></tr>
+  <tr>
+    <td>Filing Number</td><td>1234/2024</td>
+    <td>Filing Date</td><td>05-01-2024</td>
+  </tr>
+  <tr>
+    <td>Registration Number</td><td>101/2024</td>
+    <td>Registration Date:</td><td>08-01-2024</td>
+  </tr>
+  <tr>
+    <td>CNR Number</td>
+    <td>DLET010012342024 <span>(Note the CNR number for future reference)</span></td>
+  </tr>
+</table>
+<table class="table case_status_table">
+  <tr><td>First Hearing Date</td><td>10th January 2024</td></tr>
+  <tr><td>Next Hearing Date</td><td>15th March 2024</td></tr>
+  <tr><td>Case Stage</td><td>Evidence</td></tr>
+  <tr><td>Court Number and Judge</td><td>2-District Judge</td></tr>
+</table>
+<table class="table Petitioner_Advocate_table">
+  <tr><td>1) Ram Kumar<br>Advocate- A K Sharma</td></tr>
+  <tr><td>2) Shyam Kumar</td></tr>
+</table>
+<table class="table Respondent_Advocate_table">
+  <tr><td>1) Mohan Lal<br>Advocate- R Gupta</td></tr>
+</table>
+<table class="table acts_table">
+  <tr><th>Under Act(s)</th><th>Under Section(s)</th></tr>
+  <tr><td>Code of Civil Procedure</td><td>9</td></tr>
+  <tr><td>Specific Relief Act</td><td>38, 39</td></tr>
+</table>
+<table class="table history_table">
+  <thead>
+    <tr>
+      <td>Judge</td><td>Business on Date</td>
+      <td>Hearing Date</td><td>Purpose of hearing</td>
+    </tr>
+  </thead>
+  <tbody>
+    <tr>
+      <td>District Judge</td>
+      <td><a onclick="viewBusiness('2','26','10-01-2024','CS/101/2024',1)">10-01-2024</a></td>
+      <td>15-03-2024</td>
+      <td>Evidence</td>
+    </tr>
+    <tr>
+      <td>District Judge</td><td>05-01-2024</td><td>10-01-2024</td><td>Appearance</td>
+    </tr>
+  </tbody>
+</table>
+<table class="table order_table">
+  <tr><td>Order Number</td><td>Order on</td><td>Order Details</td></tr>
+  <tr>
+    <td>1</td><td>10-01-2024</td>
+    <td><a onclick="displayPdf('normal_v=1&filename=/orders/1.pdf')">Order</a></td>
+  </tr>
+</table>
+</div>
+"""
+
+
+@pytest.mark.parametrize(
+    "onclick, expected",
+    [
+        (
+            "viewHistory(208500001012024,'DLET010012342024',2,'','CScase',"
+            "26,'1',1070009,'CScase');return false;",
+            (
+                "viewHistory",
+                [
+                    "208500001012024",
+                    "DLET010012342024",
+                    "2",
+                    "",
+                    "CScase",
+                    "26",
+                    "1",
+                    "1070009",
+                    "CScase",
+                ],
+            ),
+        ),
+        ("f()", ("f", [])),
+        ("f('')", ("f", [""])),
+        ("f( 1 , 'a b' )", ("f", ["1", "a b"])),
+        ("f(\"a,b\", 'it\\'s')", ("f", ["a,b", "it's"])),
+        ("f(a, g(1,2), 'b')", ("f", ["a", "g(1,2)", "b"])),
+        ("no call here", (None, [])),
+        ("f(1, 2", (None, [])),
+        (None, (None, [])),
+    ],
+)
+def test_parse_js_call(onclick, expected):
+    assert parse_js_call(onclick) == expected
+
+
+def test_parentheses_and_commas_inside_quotes_stay_in_the_argument():
+    onclick = (
+        "javascript:displayPdf('normal_v=1&case_val=CS (COMM)/1001/2023"
+        "&court_code=2&filename=/orders/2024/x(1),y.pdf&appFlag=');"
+    )
+    name, args = parse_js_call(onclick)
+    assert name == "displayPdf"
+    assert len(args) == 1
+    params = dict(parse_qsl(args[0]))
+    assert params["case_val"] == "CS (COMM)/1001/2023"
+    assert params["filename"] == "/orders/2024/x(1),y.pdf"
+
+
+def test_case_type_in_a_quoted_argument():
+    onclick = "viewBusiness('2','26','OMP (I)(COMM.) - Arbitration, U/s 9',1)"
+    assert parse_js_call(onclick) == (
+        "viewBusiness",
+        ["2", "26", "OMP (I)(COMM.) - Arbitration, U/s 9", "1"],
+    )
+
+
+def test_cnr_from_onclick():
+    onclick = "viewHistory(123,'DLET010012342024',2,'')"
+    assert cnr_from_onclick(onclick) == "DLET010012342024"
+    assert cnr_from_onclick("displayPdf('a=1')") is None
+
+
+def test_js_call_params():
+    params = js_call_params("viewHistory(123,'DLET01',2)", VIEW_HISTORY_ARGS)
+    assert params == {"case_no": "123", "cino": "DLET01", "court_code": "2"}
+
+
+def test_parse_case_details():
+    assert parse_case_details(CASE_PAGE) == {
+        "details": {
+            "case_type": "CS - Civil Suit",
+            "filing_number": "1234/2024",
+            "filing_date": "05/01/2024",
+            "registration_number": "101/2024",
+            "registration_date": "08/01/2024",
+            "cnr_number": "DLET010012342024",
+        },
+        "status": {
+            "first_hearing_date": "10/01/2024",
+            "next_hearing_date": "15th March 2024",
+            "case_stage": "Evidence",
+            "court_number": "2-District Judge",
+        },
+        "petitioner_details": "1) Ram Kumar\nAdvocate- A K Sharma\n2) Shyam Kumar",
+        "respondent_details": "1) Mohan Lal\nAdvocate- R Gupta",
+        "acts": [
+            {"name": "Code of Civil Procedure", "sections": "9"},
+            {"name": "Specific Relief Act", "sections": "38, 39"},
+        ],
+        "history": [
+            {
+                "judge": "District Judge",
+                "date": "10-01-2024",
+                "hearing_date": "15-03-2024",
+                "purpose_of_hearing": "Evidence",
+            },
+            {
+                "judge": "District Judge",
+                "date": "05-01-2024",
+                "hearing_date": "10-01-2024",
+                "purpose_of_hearing": "Appearance",
+            },
+        ],
+        "orders": [{"date": "10-01-2024", "detail": "Order"}],
+    }
+
+
+def test_case_links_line_up_with_the_parsed_rows():
+    links = parse_case_links(CASE_PAGE)
+    assert links == {
+        "business": [
+            "viewBusiness('2','26','10-01-2024','CS/101/2024',1)",
+            None,
+        ],
+        "orders": ["displayPdf('normal_v=1&filename=/orders/1.pdf')"],
+    }
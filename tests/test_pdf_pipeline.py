@@ -0,0 +1,91 @@
+from pdf_pipeline import PdfPipeline
+
+
+class FakeBlobs:
+    """
+    Stands in for the Azure upload and the Mongo url patches.
+    """
+
+    def __init__(self):
+        self.blobs = {}
+        self.patches = []
+
+    def upload(self, stream, details):
+        data = stream.read()
+        if data == b"broken":
+            return None
+        url = f"https://blob/{len(self.blobs)}.pdf"
+        self.blobs[url] = data
+        return url
+
+    def patch(self, cnr_number, order_index, url):
+        self.patches.append((cnr_number, order_index, url))
+
+
+def case(cnr_number, orders=2):
+    return {
+        "details": {"cnr_number": cnr_number},
+        "orders": [{"date": f"0{i + 1}-02-2024", "url": ""} for i in range(orders)],
+    }
+
+
+def make_pipeline(blobs):
+    return PdfPipeline(blobs.upload, blobs.patch, workers=2)
+
+
+def test_staged_pdfs_are_uploaded_and_patched_after_commit():
+    blobs = FakeBlobs()
+    pipeline = make_pipeline(blobs)
+    case_data = case("A")
+    pipeline.stage(case_data["orders"][1], "", {}, data=b"%PDF-1")
+    pipeline.stage(case_data["orders"][0], "", {}, data=b"broken")
+
+    assert blobs.patches == []
+    pipeline.commit(case_data)
+    pipeline.close()
+
+    assert sorted(blobs.patches) == [("A", 0, ""), ("A", 1, "https://blob/0.pdf")]
+    assert pipeline.completed == 1
+    assert pipeline.failed == 1
+
+
+def test_order_missing_from_the_case_is_skipped():
+    blobs = FakeBlobs()
+    pipeline = make_pipeline(blobs)
+    case_data = case("A")
+    pipeline.stage({"date": "09-09-2024", "url": ""}, "", {}, data=b"%PDF-1")
+    pipeline.stage(case_data["orders"][0], "", {}, data=b"%PDF-2")
+
+    pipeline.commit(case_data)
+    pipeline.close()
+
+    assert blobs.patches == [("A", 0, "https://blob/0.pdf")]
+    assert pipeline.failed == 1
+
+
+def test_new_case_drops_what_an_unsaved_case_staged():
+    blobs = FakeBlobs()
+    pipeline = make_pipeline(blobs)
+    unsaved = case("A")
+    pipeline.stage(unsaved["orders"][0], "", {}, data=b"%PDF-1")
+
+    pipeline.begin_case()
+    saved = case("B", orders=1)
+    pipeline.stage(saved["orders"][0], "", {}, data=b"%PDF-2")
+    pipeline.commit(saved)
+    pipeline.close()
+
+    assert blobs.patches == [("B", 0, "https://blob/0.pdf")]
+
+
+def test_case_without_cnr_queues_nothing():
+    blobs = FakeBlobs()
+    pipeline = make_pipeline(blobs)
+    case_data = case(None)
+    pipeline.stage(case_data["orders"][0], "", {}, data=b"%PDF-1")
+
+    pipeline.commit(case_data)
+    pipeline.close()
+
+    assert blobs.patches == []
+    assert pipeline.staged == []
@@ -0,0 +1,204 @@
+"""
+Condition based waits for the eCourts pages.
+
+Every step of the scraper waits for an explicit readiness condition instead of
+sleeping for a fixed amount of time. The timeouts for all steps live in
+TIMEOUTS and every wait records how long it actually took, so that
+wait_report() can show the real latency floor of a run.
+
+Selenium is only imported once a wait actually runs, so the wait statistics
+can be collected and reported in processes that never start a browser.
+"""
+
+import time
+from collections import defaultdict
+
+# Maximum number of seconds each step may wait before it fails
+TIMEOUTS = {
+    "home": 20,
+    "state": 20,
+    "district": 20,
+    "court_complex": 20,
+    "validate_error": 3,
+    "case_type_tab": 20,
+    "case_type": 20,
+    "search_year": 20,
+    "status_radio": 20,
+    "captcha": 20,
+    "results": 30,
+    "case_details": 20,
+    "order_modal": 10,
+    "order_close": 5,
+}
+
+# How often conditions are polled
+POLL_FREQUENCY = 0.1
+
+# step -> list of seconds spent waiting
+WAIT_STATS = defaultdict(list)
+
+
+def wait_for(driver, step, condition, timeout=None):
+    """
+    Waits until `condition` is truthy and records the time it took under `step`.
+    """
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    if timeout is None:
+        timeout = TIMEOUTS[step]
+    start = time.perf_counter()
+    try:
+        return WebDriverWait(driver, timeout, poll_frequency=POLL_FREQUENCY).until(
+            condition
+        )
+    finally:
+        WAIT_STATS[step].append(time.perf_counter() - start)
+
+
+# Custom conditions ##############################################
+def option_present(locator, text):
+    """
+    The <select> at `locator` has an option with the given visible text.
+    Used for dropdowns that are filled in by an AJAX call.
+    """
+    from selenium.webdriver.common.by import By
+
+    def _predicate(driver):
+        try:
+            select = driver.find_element(*locator)
+            for option in select.find_elements(By.TAG_NAME, "option"):
+                if option.text.strip() == text:
+                    return select
+        except Exception:
+            return False
+        return False
+
+    return _predicate
+
+
+def image_loaded(locator):
+    """
+    The <img> at `locator` is visible and has finished loading.
+    """
+
+    def _predicate(driver):
+        try:
+            image = driver.find_element(*locator)
+            loaded = driver.execute_script(
+                "return arguments[0].complete && arguments[0].naturalWidth > 0;",
+                image,
+            )
+            return image if loaded and image.is_displayed() else False
+        except Exception:
+            return False
+
+    return _predicate
+
+
+def attribute_changed(locator, attribute, old_value):
+    """
+    The element at `locator` has a different `attribute` than `old_value`
+    (e.g. a refreshed captcha image gets a new src).
+    """
+
+    def _predicate(driver):
+        try:
+            element = driver.find_element(*locator)
+            return element if element.get_attribute(attribute) != old_value else False
+        except Exception:
+            return False
+
+    return _predicate
+
+
+# Returned by search_outcome() when the portal rejected the captcha
+CAPTCHA_REJECTED = "captcha rejected"
+# Returned by search_outcome() when the search has no results
+NO_RECORDS = "no records"
+
+
+def search_outcome(results_locator):
+    """
+    Either the results element (search went through), CAPTCHA_REJECTED if
+    the portal shows an "Invalid Captcha" message instead, or NO_RECORDS if
+    it shows "Record not found".
+    """
+    from selenium.webdriver.common.by import By
+
+    no_records = (
+        "//*[contains(translate(text(),'RECODNTFU','recodntfu')," "'record not found')]"
+    )
+
+    def _predicate(driver):
+        for element in driver.find_elements(*results_locator):
+            if element.is_displayed():
+                return element
+        for element in driver.find_elements(
+            By.XPATH, "//*[contains(text(),'Invalid Captcha')]"
+        ):
+            if element.is_displayed():
+                return CAPTCHA_REJECTED
+        for element in driver.find_elements(By.XPATH, no_records):
+            if element.is_displayed():
+                return NO_RECORDS
+        return False
+
+    return _predicate
+
+
+def dismiss_validate_error(driver):
+    """
+    Closes the "validateError" modal if it is open and waits until it is gone.
+    """
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+
+    try:
+        driver.execute_script("closeModel({modal_id:'validateError'})")
+        wait_for(
+            driver,
+            "validate_error",
+            EC.invisibility_of_element_located((By.ID, "validateError")),
+        )
+    except Exception:
+        pass
+
+
+# Reporting ######################################################
+def merge_wait_stats(stats):
+    """
+    Merges wait samples collected in another process into WAIT_STATS.
+    """
+    for step, samples in stats.items():
+        WAIT_STATS[step].extend(samples)
+
+
+def wait_report(stats=None):
+    """
+    Returns {step: {count, total, mean, min, max}} in seconds.
+    """
+    stats = WAIT_STATS if stats is None else stats
+    report = {}
+    for step, samples in stats.items():
+        if not samples:
+            continue
+        report[step] = {
+            "count": len(samples),
+            "total": sum(samples),
+            "mean": sum(samples) / len(samples),
+            "min": min(samples),
+            "max": max(samples),
+        }
+    return report
+
+
+def print_wait_report(stats=None):
+    report = wait_report(stats)
+    if not report:
+        return
+    print(f"{'step':<18}{'count':>7}{'mean':>9}{'min':>9}{'max':>9}{'total':>10}")
+    for step, row in sorted(report.items(), key=lambda item: -item[1]["total"]):
+        print(
+            f"{step:<18}{row['count']:>7}{row['mean']:>9.2f}"
+            f"{row['min']:>9.2f}{row['max']:>9.2f}{row['total']:>10.2f}"
+        )